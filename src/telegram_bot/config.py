@@ -19,3 +19,34 @@ PROJECT_ROOT = os.path.abspath(os.path.join(BASE_DIR, "../../"))
 JSON_DIR = os.path.join(PROJECT_ROOT, "locales")
 DB_PATH = os.path.join(PROJECT_ROOT, "bot.db")
 SESSION_FILE = os.path.join(PROJECT_ROOT, "test_session.session")
+
+# 多 worker 部署时当前 worker 的序号与 worker 总数（单进程为 0 / 1）
+WORKER_INDEX = int(os.environ.get("WORKER_INDEX", "0"))
+WORKER_COUNT = int(os.environ.get("WORKER_COUNT", "1"))
+
+# 同时处理的更新数（同一用户的更新仍逐个处理，见 utils.speed.PerUserUpdateProcessor；
+# 重量级处理器的并发上限见 utils.speed.CONCURRENCY_LIMITS）
+CONCURRENT_UPDATES = int(os.environ.get("CONCURRENT_UPDATES", "8"))
+
+# 限流后端：memory（进程内）/ sqlite（独立 SQLite 文件）/ sql（业务数据库）
+RATE_LIMIT_BACKEND = os.environ.get("RATE_LIMIT_BACKEND", "memory")
+RATE_LIMIT_DB_PATH = os.path.join(PROJECT_ROOT, "ratelimit.db")
+
+# Webhook 模式：Telegram 推送地址（完整 URL）、校验用的 secret token、监听地址与 worker 数
+WEBHOOK_URL = os.environ.get("WEBHOOK_URL", "")
+WEBHOOK_PATH = os.environ.get("WEBHOOK_PATH", "/telegram")
+WEBHOOK_SECRET = os.environ.get("WEBHOOK_SECRET", "")
+WEBHOOK_HOST = os.environ.get("WEBHOOK_HOST", "0.0.0.0")
+WEBHOOK_PORT = int(os.environ.get("WEBHOOK_PORT", "8443"))
+WEBHOOK_WORKERS = int(os.environ.get("WEBHOOK_WORKERS", "1"))
+
+
+def worker_session_file(index: int) -> str:
+    """
+    worker 的 Telethon 会话文件：0 号 worker 沿用 SESSION_FILE，其余 worker 各自单独登录
+    （同一个 auth key 被多个客户端同时使用会触发 AuthKeyDuplicatedError，会话随之作废）
+    """
+    if index == 0:
+        return SESSION_FILE
+    root, ext = os.path.splitext(SESSION_FILE)
+    return f"{root}_w{index}{ext}"
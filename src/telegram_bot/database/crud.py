@@ -1,26 +1,44 @@
+import time
 import uuid
 from datetime import datetime, timedelta
 from typing import List, Optional
 from telegram_bot.utils.logger import setup_logger
-from sqlalchemy import and_, delete, desc, exists, func, or_, select, update
-from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from telegram_bot.utils.settings_cache import (
+    KICK_SETTINGS,
+    KICK_SETTINGS_CACHE_NAME,
+    KickSettings,
+)
+from sqlalchemy import and_, bindparam, case, delete, desc, exists, func, insert, or_, select, update
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.future import select
-from sqlalchemy.orm import selectinload
 from sqlalchemy.exc import SQLAlchemyError
 
 from .models import (
     Admin,
+    CacheVersion,
     ChannelConfig,
     GroupMember,
     KickAfterInvite,
     KickLog,
+    MemberChannelStat,
     Membership,
     MembershipLog,
+    PeerCache,
+    RateLimitBucket,
     Subscription,
 )
+from .upsert import build_insert_ignore, get_dialect_name, upsert_rows
 
 logger = setup_logger(__name__)
+
+# 批量操作中单条 IN 语句的最大 id 数
+BULK_CHUNK_SIZE = 500
+
+
+def _chunks(items: list, size: int):
+    for i in range(0, len(items), size):
+        yield items[i : i + size]
+
 # -----------------
 # subscription.py
 # -----------------
@@ -80,10 +98,8 @@ async def can_user_resubscribe(session: AsyncSession, user_id: int) -> bool:
             # 安全兜底：没有被封禁时间，认为暂不允许
             return False
 
-        # 获取 rejoin_delay_minutes 设置
-        config_stmt = select(KickAfterInvite).limit(1)
-        config_result = await session.execute(config_stmt)
-        config = config_result.scalar_one_or_none()
+        # 获取 rejoin_delay_minutes 设置（进程内缓存）
+        config = await KICK_SETTINGS.get(session)
 
         if not config:
             # 没有配置则默认禁止重新加入
@@ -172,121 +188,204 @@ async def get_user_channels(session: AsyncSession, user_id: int):
 # -----------------
 
 
-async def check_vip_status(session):
+# 会员列表分页：按 (end_time, id) 倒序做 keyset 分页，after 为上一页最后一条的 (end_time, id)
+# 没有游标时（如跳页）退回 offset
+async def get_vip_page(
+    session: AsyncSession, limit: int, after: Optional[tuple] = None, offset: int = 0
+) -> List[Membership]:
     try:
-        result = await session.execute(
+        stmt = (
             select(Membership)
-            .order_by(Membership.end_time.desc())
-            .options(selectinload(Membership.subscription))
+            .order_by(Membership.end_time.desc(), Membership.id.desc())
+            .limit(limit)
         )
-        members = result.scalars().all()
-        return members
+        if after:
+            end_time, member_id = after
+            stmt = stmt.where(
+                or_(
+                    Membership.end_time < end_time,
+                    and_(Membership.end_time == end_time, Membership.id < member_id),
+                )
+            )
+        elif offset:
+            stmt = stmt.offset(offset)
+        result = await session.execute(stmt)
+        return result.scalars().all()
     except SQLAlchemyError as e:
         logger.error(e)
-        return False
+        return []
     except Exception as e:
         logger.error(e)
-        return False
+        return []
+
 
+async def count_memberships(session: AsyncSession) -> int:
+    try:
+        result = await session.execute(select(func.count(Membership.id)))
+        return result.scalar_one()
+    except SQLAlchemyError as e:
+        logger.error(e)
+        return 0
+    except Exception as e:
+        logger.error(e)
+        return 0
 
 
 # 会员添加
+# 批量处理：订阅、已处理日志、会员记录各用一次 IN 查询加载，内存中计算续期结果，
+# 再一次性写回（更新仍带 version 乐观锁，冲突按 UUID 上报）
 
 async def process_memberships_by_uuids(
     session: AsyncSession, uuid_list: List[str]
 ) -> dict:
     added = 0
     renewed = 0
+    deadlines = {}
+    conflicts = []
     now = datetime.utcnow()
 
+    # 去重并保持输入顺序（同一用户的多笔交易按顺序叠加）
+    uuids = list(dict.fromkeys(u.strip() for u in uuid_list if u.strip()))
+    if not uuids:
+        return {"added": 0, "renewed": 0, "deadlines": {}, "conflicts": []}
+
     try:
-        for uuid_str in uuid_list:
-            uuid_str = uuid_str.strip()
+        result = await session.execute(
+            select(Subscription).where(Subscription.uuid.in_(uuids))
+        )
+        sub_by_uuid = {sub.uuid: sub for sub in result.scalars().all()}
+        subs = [
+            sub_by_uuid[u]
+            for u in uuids
+            if u in sub_by_uuid and sub_by_uuid[u].status != "failed"
+        ]
+
+        # 避免重复处理
+        processed_ids = set()
+        if subs:
             result = await session.execute(
-                select(Subscription).where(Subscription.uuid == uuid_str)
-            )
-            sub = result.scalars().first()
-
-            if not sub or sub.status == "failed":
-                continue
-
-            # 避免重复处理
-            log_check = await session.execute(
-                select(MembershipLog).where(MembershipLog.subscription_id == sub.id)
+                select(MembershipLog.subscription_id).where(
+                    MembershipLog.subscription_id.in_([sub.id for sub in subs])
+                )
             )
-            if log_check.scalar_one_or_none():
-                continue
+            processed_ids = set(result.scalars().all())
+        subs = [sub for sub in subs if sub.id not in processed_ids]
+        if not subs:
+            return {"added": 0, "renewed": 0, "deadlines": {}, "conflicts": []}
 
-            # 查询当前会员记录
-            mem_result = await session.execute(
-                select(Membership)
-                .where(Membership.user_id == sub.user_id)
-                .order_by(Membership.end_time.desc())
-                .limit(1)
+        # 查询当前会员记录
+        result = await session.execute(
+            select(Membership).where(
+                Membership.user_id.in_({sub.user_id for sub in subs})
             )
-            membership = mem_result.scalars().first()
-
-            sub.status = "success"
-
-            if membership:
-                # 记录当前 version
-                old_version = membership.version
-
-                # 计算新的 end_time
-                new_end_time = max(membership.end_time, now) + timedelta(hours=sub.hours)
-
-                # 乐观锁更新
-                result = await session.execute(
-                    update(Membership)
-                    .where(
-                        Membership.id == membership.id,
-                        Membership.version == old_version
-                    )
-                    .values(
-                        end_time=new_end_time,
-                        version=old_version + 1
-                    )
-                )
-                if result.rowcount == 0:
-                    # 并发冲突
-                    logger.warning(f"⚠️ 并发冲突跳过 UUID: {uuid_str}")
-                    continue
-
-                renewed += 1
-                operation = "renew"
-                remark = f"通过交易 {uuid_str} 续期 {sub.hours}小时"
-                old_end_time = membership.end_time
-
-            else:
+        )
+        memberships = {m.user_id: m for m in result.scalars().all()}
+
+        # 内存中计算每笔交易后的到期时间
+        end_times = {user_id: m.end_time for user_id, m in memberships.items()}
+        new_members = {}
+        entries = []  # (sub, operation, old_end_time, new_end_time)
+        for sub in subs:
+            old_end_time = end_times.get(sub.user_id)
+            if old_end_time is None:
                 # 新开通会员
-                new_member = Membership(
+                new_end_time = now + timedelta(hours=sub.hours)
+                new_members[sub.user_id] = Membership(
                     user_id=sub.user_id,
                     subscription_id=sub.id,
                     start_time=now,
-                    end_time=now + timedelta(hours=sub.hours),
+                    end_time=new_end_time,
                     source="admin_manual",
                     remark="手动开通",
                     version=1,
                 )
-                session.add(new_member)
-                membership = new_member
-                old_end_time = None
                 operation = "new"
-                remark = f"通过交易 {uuid_str} 开通 {sub.hours}小时"
-                added += 1
+            else:
+                new_end_time = max(old_end_time, now) + timedelta(hours=sub.hours)
+                operation = "renew"
+            end_times[sub.user_id] = new_end_time
+            entries.append((sub, operation, old_end_time, new_end_time))
+
+        # 已有会员：一次 executemany 乐观锁更新，再回查确认哪些写入成功
+        renew_users = {
+            sub.user_id for sub, operation, _, _ in entries if operation == "renew"
+        } - set(new_members)
+        conflict_users = set()
+        if renew_users:
+            table = Membership.__table__
+            await session.execute(
+                update(table)
+                .where(
+                    table.c.id == bindparam("m_id"),
+                    table.c.version == bindparam("m_version"),
+                )
+                .values(
+                    end_time=bindparam("m_end_time"),
+                    version=bindparam("m_new_version"),
+                    updated_at=now,
+                ),
+                [
+                    {
+                        "m_id": memberships[user_id].id,
+                        "m_version": memberships[user_id].version,
+                        "m_end_time": end_times[user_id],
+                        "m_new_version": memberships[user_id].version + 1,
+                    }
+                    for user_id in renew_users
+                ],
+            )
+            result = await session.execute(
+                select(Membership.user_id, Membership.version, Membership.end_time).where(
+                    Membership.id.in_([memberships[u].id for u in renew_users])
+                )
+            )
+            for user_id, version, end_time in result.all():
+                if (
+                    version != memberships[user_id].version + 1
+                    or end_time != end_times[user_id]
+                ):
+                    conflict_users.add(user_id)
+
+        # 同一批次内新开通后又续期的会员，直接以最终到期时间插入
+        for user_id, member in new_members.items():
+            member.end_time = end_times[user_id]
+        session.add_all(new_members.values())
+
+        logs = []
+        for sub, operation, old_end_time, new_end_time in entries:
+            if sub.user_id in conflict_users:
+                # 并发冲突
+                logger.warning(f"⚠️ 并发冲突跳过 UUID: {sub.uuid}")
+                conflicts.append(sub.uuid)
+                continue
 
-            log = MembershipLog(
-                user_id=sub.user_id,
-                subscription_id=sub.id,
-                operation=operation,
-                old_end_time=old_end_time,
-                new_end_time=membership.end_time,
-                remark=remark,
+            sub.status = "success"
+            if operation == "renew":
+                renewed += 1
+                remark = f"通过交易 {sub.uuid} 续期 {sub.hours}小时"
+            else:
+                added += 1
+                remark = f"通过交易 {sub.uuid} 开通 {sub.hours}小时"
+            deadlines[sub.user_id] = new_end_time
+            logs.append(
+                MembershipLog(
+                    user_id=sub.user_id,
+                    subscription_id=sub.id,
+                    operation=operation,
+                    old_end_time=old_end_time,
+                    new_end_time=new_end_time,
+                    remark=remark,
+                )
             )
-            session.add(log)
+        session.add_all(logs)
 
         await session.commit()
-        return {"added": added, "renewed": renewed}
+        return {
+            "added": added,
+            "renewed": renewed,
+            "deadlines": deadlines,
+            "conflicts": conflicts,
+        }
 
     except SQLAlchemyError as e:
         logger.error(f"数据库错误: {e}")
@@ -299,41 +398,61 @@ async def process_memberships_by_uuids(
 
 
 # 删除会员
-async def delete_memberships(session: AsyncSession, user_id_list: List[int]) -> int:
-    deleted_count = 0
+# 批量：一次查询现有记录、一条 DELETE、一条多行日志 INSERT（按 BULK_CHUNK_SIZE 分批）
+# 返回 {user_id: "deleted" / "not_found"}
+async def delete_memberships(session: AsyncSession, user_id_list: List[int]) -> dict:
+    outcomes = {}
     current_time = datetime.utcnow()
+    user_ids = list(dict.fromkeys(user_id_list))
 
-    for user_id in user_id_list:
-        try:
+    try:
+        for chunk in _chunks(user_ids, BULK_CHUNK_SIZE):
             result = await session.execute(
-                select(Membership).where(Membership.user_id == user_id)
+                select(
+                    Membership.user_id, Membership.subscription_id, Membership.end_time
+                ).where(Membership.user_id.in_(chunk))
             )
-            member = result.scalars().first()
-
-            if member:
-                # 记录删除操作
-                log = MembershipLog(
-                    user_id=user_id,
-                    subscription_id=member.subscription_id,
-                    operation="delete",
-                    old_end_time=member.end_time,
-                    new_end_time=current_time,
-                    remark="管理员手动删除会员",
-                )
-                session.add(log)
-
-                # 删除会员
-                await session.delete(member)
-                deleted_count += 1
-        except SQLAlchemyError as e:
-            logger.error(e)
-            return 0
-        except Exception as e:
-            logger.error(e)
-            return 0
+            members = result.all()
+            outcomes.update({user_id: "not_found" for user_id in chunk})
+            if not members:
+                continue
 
-    await session.commit()
-    return deleted_count
+            found = [m.user_id for m in members]
+            await session.execute(
+                delete(Membership)
+                .where(Membership.user_id.in_(found))
+                .execution_options(synchronize_session=False)
+            )
+
+            # 记录删除操作
+            await session.execute(
+                insert(MembershipLog),
+                [
+                    {
+                        "user_id": m.user_id,
+                        "subscription_id": m.subscription_id,
+                        "operation": "delete",
+                        "old_end_time": m.end_time,
+                        "new_end_time": current_time,
+                        "remark": "管理员手动删除会员",
+                        "created_at": current_time,
+                        "updated_at": current_time,
+                    }
+                    for m in members
+                ],
+            )
+            outcomes.update({user_id: "deleted" for user_id in found})
+
+        await session.commit()
+        return outcomes
+    except SQLAlchemyError as e:
+        await session.rollback()
+        logger.error(e)
+        return {}
+    except Exception as e:
+        await session.rollback()
+        logger.error(e)
+        return {}
 
 
 # -----------------
@@ -341,27 +460,166 @@ async def delete_memberships(session: AsyncSession, user_id_list: List[int]) ->
 # -----------------
 
 
-async def get_mem_all_chan(session):
+async def get_user_channel_ids(session: AsyncSession, user_id: int) -> set:
+    """从 group_members 缓存中查询用户所在的频道 id"""
+    try:
+        result = await session.execute(
+            select(GroupMember.channel_id).where(
+                GroupMember.user_id == user_id,
+                GroupMember.is_deleted == False,
+                GroupMember.left_at.is_(None),
+            )
+        )
+        return set(result.scalars().all())
+    except SQLAlchemyError as e:
+        logger.error(e)
+        return set()
+    except Exception as e:
+        logger.error(e)
+        return set()
+
+
+# 每个用户加入频道数的聚合表，由成员同步按受影响用户增量维护
+MEMBER_STAT_UPDATE_COLUMNS = ("username", "first_name", "channel_count", "updated_at")
+
+
+def _member_stat_select():
+    return select(
+        GroupMember.user_id,
+        func.max(GroupMember.username),
+        func.max(GroupMember.first_name),
+        func.count(GroupMember.channel_id),
+    ).where(
+        GroupMember.is_bot == False,
+        GroupMember.is_deleted == False,
+        GroupMember.left_at.is_(None),
+    )
+
+
+async def _write_member_stats(session: AsyncSession, rows, now: datetime):
+    await upsert_rows(
+        session,
+        MemberChannelStat,
+        [
+            {
+                "user_id": user_id,
+                "username": username,
+                "first_name": first_name,
+                "channel_count": count,
+                "created_at": now,
+                "updated_at": now,
+            }
+            for user_id, username, first_name, count in rows
+        ],
+        ("user_id",),
+        MEMBER_STAT_UPDATE_COLUMNS,
+    )
+
+
+async def refresh_member_stats(session: AsyncSession, user_ids) -> int:
+    """重新统计指定用户的频道数（已不在任何频道的用户从聚合表删除）"""
+    now = datetime.utcnow()
+    user_ids = list(dict.fromkeys(user_ids))
+    try:
+        for chunk in _chunks(user_ids, BULK_CHUNK_SIZE):
+            result = await session.execute(
+                _member_stat_select()
+                .where(GroupMember.user_id.in_(chunk))
+                .group_by(GroupMember.user_id)
+            )
+            rows = result.all()
+            await _write_member_stats(session, rows, now)
+
+            gone = set(chunk) - {row[0] for row in rows}
+            if gone:
+                await session.execute(
+                    delete(MemberChannelStat).where(MemberChannelStat.user_id.in_(gone))
+                )
+        await session.commit()
+        return len(user_ids)
+    except SQLAlchemyError as e:
+        await session.rollback()
+        logger.error(e)
+        return False
+    except Exception as e:
+        await session.rollback()
+        logger.error(e)
+        return False
+
+
+async def rebuild_member_stats(session: AsyncSession) -> int:
+    """全量重建聚合表（聚合表为空时由成员同步调用一次）"""
+    now = datetime.utcnow()
+    try:
+        await session.execute(delete(MemberChannelStat))
+        result = await session.execute(
+            _member_stat_select().group_by(GroupMember.user_id)
+        )
+        rows = result.all()
+        for chunk in _chunks(rows, BULK_CHUNK_SIZE):
+            await _write_member_stats(session, chunk, now)
+        await session.commit()
+        return len(rows)
+    except SQLAlchemyError as e:
+        await session.rollback()
+        logger.error(e)
+        return False
+    except Exception as e:
+        await session.rollback()
+        logger.error(e)
+        return False
+
+
+async def count_member_stats(session: AsyncSession) -> int:
+    try:
+        result = await session.execute(select(func.count(MemberChannelStat.id)))
+        return result.scalar_one()
+    except SQLAlchemyError as e:
+        logger.error(e)
+        return 0
+    except Exception as e:
+        logger.error(e)
+        return 0
+
+
+# 按 (channel_count, user_id) 倒序 keyset 分页，after 为上一页最后一条的 (channel_count, user_id)
+async def get_member_stats_page(
+    session: AsyncSession, limit: int, after: Optional[tuple] = None, offset: int = 0
+):
     try:
         stmt = (
             select(
-                GroupMember.user_id,
-                GroupMember.username,
-                GroupMember.first_name,
-                func.count(GroupMember.channel_id).label("channel_count"),
+                MemberChannelStat.user_id,
+                MemberChannelStat.username,
+                MemberChannelStat.first_name,
+                MemberChannelStat.channel_count,
+            )
+            .order_by(
+                MemberChannelStat.channel_count.desc(), MemberChannelStat.user_id.desc()
             )
-            .where(GroupMember.is_bot == False, GroupMember.is_deleted == False)
-            .group_by(GroupMember.user_id, GroupMember.username, GroupMember.first_name)
-            .order_by(func.count(GroupMember.channel_id).desc())
+            .limit(limit)
         )
+        if after:
+            count, user_id = after
+            stmt = stmt.where(
+                or_(
+                    MemberChannelStat.channel_count < count,
+                    and_(
+                        MemberChannelStat.channel_count == count,
+                        MemberChannelStat.user_id < user_id,
+                    ),
+                )
+            )
+        elif offset:
+            stmt = stmt.offset(offset)
         result = await session.execute(stmt)
         return result.all()
     except SQLAlchemyError as e:
         logger.error(e)
-        return False
+        return []
     except Exception as e:
         logger.error(e)
-        return False
+        return []
 
 
 # 频道信息添加
@@ -443,7 +701,9 @@ async def get_channel_by_url(session: AsyncSession, url: str):
 # -----------------
 
 
-async def get_expired_memberships(session) -> List[Membership]:
+async def get_expired_memberships(
+    session, user_ids: Optional[List[int]] = None
+) -> List[Membership]:
     now = datetime.utcnow()
     try:
         stmt = select(Membership).where(
@@ -451,6 +711,8 @@ async def get_expired_memberships(session) -> List[Membership]:
             Membership.is_banned == False,
             Membership.banned_at.is_(None),
         )
+        if user_ids is not None:
+            stmt = stmt.where(Membership.user_id.in_(user_ids))
         result = await session.execute(stmt)
         return result.scalars().all()
     except SQLAlchemyError as e:
@@ -461,6 +723,27 @@ async def get_expired_memberships(session) -> List[Membership]:
         return []
 
 
+# 待到期会员的 (user_id, end_time)，供到期调度器加载（可只取指定用户）
+async def get_membership_deadlines(
+    session: AsyncSession, user_ids: Optional[List[int]] = None
+) -> List[tuple]:
+    try:
+        stmt = select(Membership.user_id, Membership.end_time).where(
+            Membership.is_banned == False,
+            Membership.banned_at.is_(None),
+        )
+        if user_ids is not None:
+            stmt = stmt.where(Membership.user_id.in_(user_ids))
+        result = await session.execute(stmt)
+        return [tuple(row) for row in result.all()]
+    except SQLAlchemyError as e:
+        logger.error(e)
+        return []
+    except Exception as e:
+        logger.error(e)
+        return []
+
+
 # 检查即将过期的会员
 async def get_expiring_soon_memberships(
     session: AsyncSession, within_days: int = 3
@@ -494,6 +777,7 @@ async def set_or_get_kick_config(
 ) -> KickAfterInvite:
     """
     如果传入了值则更新，否则返回当前配置。
+    写入时版本号 +1，其他 worker 的设置缓存据此重新读取。
     """
 
     stmt = select(KickAfterInvite).limit(1)
@@ -510,8 +794,11 @@ async def set_or_get_kick_config(
     if rejoin_delay_minutes is not None:
         config.rejoin_delay_minutes = rejoin_delay_minutes
 
+    if session.new or session.dirty:
+        await bump_cache_version(session, KICK_SETTINGS_CACHE_NAME)
     await session.commit()
     await session.refresh(config)
+    KICK_SETTINGS.update(config)
     return config
 
 
@@ -523,37 +810,84 @@ async def get_vip_channels(session: AsyncSession) -> List[ChannelConfig]:
     return result.scalars().all()
 
 
-async def get_kick_setting(session: AsyncSession) -> Optional[KickAfterInvite]:
-    """获取踢人设置"""
-    result = await session.execute(select(KickAfterInvite).limit(1))
-    return result.scalar_one_or_none()
+async def get_kick_setting(session: AsyncSession) -> Optional[KickSettings]:
+    """获取踢人设置（进程内缓存，其他 worker 写入后按版本号重新读取）"""
+    return await KICK_SETTINGS.get(session)
 
 
-async def record_kick(
+async def record_kicks_bulk(
     session: AsyncSession,
-    user_id: int,
-    channel_id: int,
+    kicks: List[tuple],
     kicked_at: datetime = None,
-) -> KickLog:
-    """记录踢人操作"""
+) -> int:
+    """批量记录踢人操作，kicks 为 (user_id, channel_id) 列表，一次提交"""
+    if not kicks:
+        return 0
     if kicked_at is None:
         kicked_at = datetime.utcnow()
 
-    kick_record = KickLog(
-        target_user_id=user_id,
-        channel_id=channel_id,
-        kicked_at=kicked_at,
+    rows = [
+        {
+            "target_user_id": user_id,
+            "channel_id": channel_id,
+            "kicked_at": kicked_at,
+            "created_at": kicked_at,
+            "updated_at": kicked_at,
+        }
+        for user_id, channel_id in kicks
+    ]
+    try:
+        await session.execute(insert(KickLog), rows)
+        await session.commit()
+        return len(rows)
+    except SQLAlchemyError as e:
+        await session.rollback()
+        logger.error(e)
+        return 0
+    except Exception as e:
+        await session.rollback()
+        logger.error(e)
+        return 0
+
+
+# 进程内缓存的版本号，数据变化时 +1，其他进程据此发现缓存已过期
+ADMIN_CACHE_NAME = "admins"
+
+
+async def get_cache_version(session: AsyncSession, name: str) -> int:
+    try:
+        result = await session.execute(
+            select(CacheVersion.version).where(CacheVersion.name == name)
+        )
+        return result.scalar_one_or_none() or 0
+    except SQLAlchemyError as e:
+        logger.error(e)
+        return 0
+    except Exception as e:
+        logger.error(e)
+        return 0
+
+
+async def bump_cache_version(session: AsyncSession, name: str):
+    """版本号 +1（不提交，随调用方的事务一起提交）"""
+    result = await session.execute(
+        update(CacheVersion)
+        .where(CacheVersion.name == name)
+        .values(version=CacheVersion.version + 1)
     )
-    session.add(kick_record)
-    await session.commit()
-    return kick_record
+    if result.rowcount == 0:
+        session.add(CacheVersion(name=name, version=1))
 
 
 async def add_admin(
-    session: AsyncSession, operator_user_id: int, new_admin_data: dict
+    session: AsyncSession,
+    operator_user_id: int,
+    new_admin_data: dict,
+    operator_level: Optional[int] = None,
 ) -> str:
     """
     添加管理员，普通管理员不能添加超级管理员
+    operator_level 已知时（来自管理员缓存）不再查询操作者
     new_admin_data 示例: {
         "user_id": 123456,
         "username": "abc",
@@ -562,15 +896,17 @@ async def add_admin(
     }
     """
     try:
-    # 查询操作者权限
-        result = await session.execute(
-            select(Admin).where(Admin.user_id == operator_user_id)
-        )
-        operator = result.scalars().first()
-        if not operator:
-            return f"❌ 操作者无权限"
+        if operator_level is None:
+            # 查询操作者权限
+            result = await session.execute(
+                select(Admin).where(Admin.user_id == operator_user_id)
+            )
+            operator = result.scalars().first()
+            if not operator:
+                return f"❌ 操作者无权限"
+            operator_level = operator.level
 
-        if operator.level < 10 and new_admin_data.get("level", 1) == 10:
+        if operator_level < 10 and new_admin_data.get("level", 1) == 10:
             return "❌ 权限不足，不能添加超级管理员"
 
         # 检查目标用户是否已存在
@@ -583,6 +919,7 @@ async def add_admin(
 
         new_admin = Admin(**new_admin_data)
         session.add(new_admin)
+        await bump_cache_version(session, ADMIN_CACHE_NAME)
         await session.commit()
 
         return "✅ 添加管理员成功"
@@ -595,27 +932,34 @@ async def add_admin(
 
 
 async def delete_admin(
-    session: AsyncSession, operator_user_id: int, target_user_id: int
+    session: AsyncSession,
+    operator_user_id: int,
+    target_user_id: int,
+    operator_level: Optional[int] = None,
 ) -> str:
     """
     删除管理员，普通管理员不能删除超级管理员
+    operator_level 已知时（来自管理员缓存）不再查询操作者
     """
-    result = await session.execute(
-        select(Admin).where(Admin.user_id == operator_user_id)
-    )
-    operator = result.scalars().first()
-    if not operator:
-        return "❌ 操作者无权限"
+    if operator_level is None:
+        result = await session.execute(
+            select(Admin).where(Admin.user_id == operator_user_id)
+        )
+        operator = result.scalars().first()
+        if not operator:
+            return "❌ 操作者无权限"
+        operator_level = operator.level
 
     result = await session.execute(select(Admin).where(Admin.user_id == target_user_id))
     target = result.scalars().first()
     if not target:
         return "⚠️ 目标用户不是管理员"
 
-    if operator.level < 10 and target.level == 10:
+    if operator_level < 10 and target.level == 10:
         return "❌ 权限不足，不能删除超级管理员"
 
     await session.delete(target)
+    await bump_cache_version(session, ADMIN_CACHE_NAME)
     await session.commit()
     return "✅ 管理员已删除"
 
@@ -643,41 +987,86 @@ async def list_admins(session: AsyncSession) -> List[dict]:
 # -----------------
 
 
+# 批量封禁：一次查询、一条 UPDATE（version + 1，仅更新未封禁的记录）、一条多行日志 INSERT
+# 返回 {user_id: "banned" / "already_banned" / "not_found" / "conflict"}
 async def set_ban_members(session: AsyncSession, user_ids: List[int]):
     if not user_ids:
-        return
+        return {}
 
     ban_time = datetime.utcnow()
+    outcomes = {}
 
     try:
-        for user_id in user_ids:
-            # 获取当前记录和版本号
+        for chunk in _chunks(list(dict.fromkeys(user_ids)), BULK_CHUNK_SIZE):
             result = await session.execute(
-                select(Membership).where(Membership.user_id == user_id)
+                select(
+                    Membership.user_id,
+                    Membership.subscription_id,
+                    Membership.end_time,
+                    Membership.is_banned,
+                ).where(Membership.user_id.in_(chunk))
             )
-            member = result.scalars().first()
-            if not member:
+            members = {m.user_id: m for m in result.all()}
+            for user_id in chunk:
+                member = members.get(user_id)
+                if not member:
+                    outcomes[user_id] = "not_found"
+                elif member.is_banned:
+                    outcomes[user_id] = "already_banned"
+
+            to_ban = [u for u, m in members.items() if not m.is_banned]
+            if not to_ban:
                 continue
 
-            old_version = member.version
-
             stmt = (
                 update(Membership)
                 .where(
-                    Membership.user_id == user_id,
-                    Membership.version == old_version,
+                    Membership.user_id.in_(to_ban),
                     Membership.is_banned == False  # 避免重复操作
                 )
                 .values(
                     is_banned=True,
                     banned_at=ban_time,
-                    version=old_version + 1
+                    version=Membership.version + 1,
                 )
+                .execution_options(synchronize_session=False)
             )
+            result = await session.execute(stmt)
 
-            await session.execute(stmt)
+            banned = to_ban
+            if result.rowcount != len(to_ban):
+                # 查询与更新之间有其他事务改动，回查哪些是本次封禁的
+                result = await session.execute(
+                    select(Membership.user_id).where(
+                        Membership.user_id.in_(to_ban),
+                        Membership.banned_at == ban_time,
+                    )
+                )
+                banned = list(result.scalars().all())
+                for user_id in set(to_ban) - set(banned):
+                    outcomes[user_id] = "conflict"
+
+            if banned:
+                await session.execute(
+                    insert(MembershipLog),
+                    [
+                        {
+                            "user_id": user_id,
+                            "subscription_id": members[user_id].subscription_id,
+                            "operation": "ban",
+                            "old_end_time": members[user_id].end_time,
+                            "new_end_time": members[user_id].end_time,
+                            "remark": "会员到期封禁",
+                            "created_at": ban_time,
+                            "updated_at": ban_time,
+                        }
+                        for user_id in banned
+                    ],
+                )
+            outcomes.update({user_id: "banned" for user_id in banned})
 
         await session.commit()
+        return outcomes
     except SQLAlchemyError as e:
         await session.rollback()
         logger.error(e)
@@ -732,48 +1121,158 @@ async def recover_ban(session: AsyncSession):
         return False
 
 
-async def save_chan_mem(session: AsyncSession, user, channel_id: int):
-    now = datetime.utcnow()
+GROUP_MEMBER_KEYS = ("channel_id", "user_id")
+GROUP_MEMBER_UPDATE_COLUMNS = (
+    "username",
+    "first_name",
+    "last_name",
+    "is_bot",
+    "is_deleted",
+    "cached_at",
+    "left_at",
+    "updated_at",
+)
+
+
+def _member_row(user, channel_id: int, now: datetime) -> dict:
+    return {
+        "user_id": user.id,
+        "channel_id": channel_id,
+        "username": user.username,
+        "first_name": user.first_name,
+        "last_name": user.last_name,
+        "is_bot": user.bot,
+        "is_deleted": user.deleted,
+        "cached_at": now,
+        "left_at": None,
+        "created_at": now,
+        "updated_at": now,
+    }
+
+
+async def get_channel_members(
+    session: AsyncSession, channel_id: int, user_ids: Optional[List[int]] = None
+) -> dict:
+    """
+    读取频道已存的成员快照（可只取指定用户），用于和新抓取的成员比对。
+    返回 {user_id: (username, first_name, last_name, 是否仍在群内)}，失败返回 False。
+    """
+    stmt = select(
+        GroupMember.user_id,
+        GroupMember.username,
+        GroupMember.first_name,
+        GroupMember.last_name,
+        GroupMember.left_at,
+    ).where(GroupMember.channel_id == channel_id)
+    if user_ids is not None:
+        stmt = stmt.where(GroupMember.user_id.in_(user_ids))
     try:
-        stmt = (
-            sqlite_insert(GroupMember)
-            .values(
-                user_id=user.id,
-                channel_id=channel_id,
-                username=user.username,
-                first_name=user.first_name,
-                last_name=user.last_name,
-                is_bot=user.bot,
-                is_deleted=user.deleted,
-                cached_at=now,
-            )
-            .on_conflict_do_update(
-                index_elements=["channel_id", "user_id"],
-                set_={
-                    "username": user.username,
-                    "first_name": user.first_name,
-                    "last_name": user.last_name,
-                    "is_bot": user.bot,
-                    "is_deleted": user.deleted,
-                    "cached_at": now,
-                },
+        result = await session.execute(stmt)
+        return {
+            user_id: (username, first_name, last_name, left_at is None)
+            for user_id, username, first_name, last_name, left_at in result.all()
+        }
+    except SQLAlchemyError as e:
+        logger.error(e)
+        return False
+    except Exception as e:
+        logger.error(e)
+        return False
+
+
+async def get_channel_member_ids(session: AsyncSession, channel_id: int) -> set:
+    """频道中仍在群内的成员 id"""
+    try:
+        result = await session.execute(
+            select(GroupMember.user_id).where(
+                GroupMember.channel_id == channel_id,
+                GroupMember.left_at.is_(None),
             )
         )
+        return set(result.scalars().all())
+    except SQLAlchemyError as e:
+        logger.error(e)
+        return set()
+    except Exception as e:
+        logger.error(e)
+        return set()
 
-        await session.execute(stmt)
+
+async def apply_member_diff(
+    session: AsyncSession,
+    channel_id: int,
+    changed_users,
+    left_user_ids: List[int],
+    clear_hash: bool = False,
+):
+    """
+    只写入成员变化：新加入 / 资料变化的成员 upsert（同时清空 left_at），
+    已退群的成员标记 left_at。返回 (写入数, 退群数)，失败返回 False。
+    clear_hash=True 时同时清空该频道的 member_hash（实时跟踪写入的变化不在上次
+    同步的快照里，下次全量同步不能因摘要一致而跳过退群核对）。
+    """
+    now = datetime.utcnow()
+    try:
+        for chunk in _chunks(list(changed_users), BULK_CHUNK_SIZE):
+            await upsert_rows(
+                session,
+                GroupMember,
+                [_member_row(user, channel_id, now) for user in chunk],
+                GROUP_MEMBER_KEYS,
+                GROUP_MEMBER_UPDATE_COLUMNS,
+            )
+        for chunk in _chunks(list(left_user_ids), BULK_CHUNK_SIZE):
+            await session.execute(
+                update(GroupMember)
+                .where(
+                    GroupMember.channel_id == channel_id,
+                    GroupMember.user_id.in_(chunk),
+                    GroupMember.left_at.is_(None),
+                )
+                .values(left_at=now, updated_at=now)
+            )
+        if clear_hash and (changed_users or left_user_ids):
+            await session.execute(
+                update(ChannelConfig)
+                .where(ChannelConfig.channel_id == channel_id)
+                .values(member_hash=None)
+            )
         await session.commit()
+        return len(changed_users), len(left_user_ids)
     except SQLAlchemyError as e:
+        await session.rollback()
         logger.error(e)
         return False
     except Exception as e:
+        await session.rollback()
         logger.error(e)
         return False
 
 
+async def get_tracked_channel_ids(session: AsyncSession) -> set:
+    """已配置且解析出 channel_id 的频道，供实时成员跟踪过滤事件"""
+    try:
+        result = await session.execute(
+            select(ChannelConfig.channel_id).where(ChannelConfig.channel_id.is_not(None))
+        )
+        return set(result.scalars().all())
+    except SQLAlchemyError as e:
+        logger.error(e)
+        return set()
+    except Exception as e:
+        logger.error(e)
+        return set()
+
+
 async def fetch_config_group(session: AsyncSession, cutoff_time):
     try:
         re = await session.execute(
-            select(ChannelConfig.channel_url).where(
+            select(
+                ChannelConfig.channel_url,
+                ChannelConfig.member_hash,
+                ChannelConfig.is_vip_channel,
+                ChannelConfig.last_member_fetch_at,
+            ).where(
                 or_(
                     ChannelConfig.last_member_fetch_at.is_(None),
                     ChannelConfig.last_member_fetch_at < cutoff_time,
@@ -789,16 +1288,173 @@ async def fetch_config_group(session: AsyncSession, cutoff_time):
         return False
 
 
-async def update_config_time(session: AsyncSession, group_url):
+async def update_config_time(session: AsyncSession, group_url, member_hash=None):
+    values = {"last_member_fetch_at": datetime.utcnow()}
+    if member_hash is not None:
+        values["member_hash"] = member_hash
     try:
         await session.execute(
             update(ChannelConfig)
             .where(ChannelConfig.channel_url == group_url)
-            .values(last_member_fetch_at=datetime.utcnow())
+            .values(**values)
+        )
+    except SQLAlchemyError as e:
+        logger.error(e)
+        return False
+    except Exception as e:
+        logger.error(e)
+        return False
+
+
+# -----------------
+# entity_cache.py
+# -----------------
+
+
+PEER_CACHE_UPDATE_COLUMNS = (
+    "peer_type",
+    "peer_id",
+    "access_hash",
+    "megagroup",
+    "detailed",
+    "title",
+    "username",
+    "resolved_at",
+    "updated_at",
+)
+
+
+async def get_peer_cache(session: AsyncSession, lookup_key: str, not_before: datetime):
+    try:
+        result = await session.execute(
+            select(PeerCache).where(
+                PeerCache.lookup_key == lookup_key,
+                PeerCache.resolved_at >= not_before,
+            )
+        )
+        return result.scalar_one_or_none()
+    except SQLAlchemyError as e:
+        logger.error(e)
+        return None
+    except Exception as e:
+        logger.error(e)
+        return None
+
+
+async def save_peer_cache(session: AsyncSession, rows: List[dict]):
+    """按 lookup_key 写入/刷新实体缓存"""
+    now = datetime.utcnow()
+    for row in rows:
+        row.setdefault("resolved_at", now)
+        row.setdefault("created_at", now)
+        row.setdefault("updated_at", now)
+    try:
+        await upsert_rows(
+            session, PeerCache, rows, ("lookup_key",), PEER_CACHE_UPDATE_COLUMNS
         )
+        await session.commit()
     except SQLAlchemyError as e:
+        await session.rollback()
         logger.error(e)
         return False
     except Exception as e:
+        await session.rollback()
         logger.error(e)
         return False
+
+
+async def delete_peer_cache(session: AsyncSession, lookup_key: str):
+    try:
+        await session.execute(delete(PeerCache).where(PeerCache.lookup_key == lookup_key))
+        await session.commit()
+    except SQLAlchemyError as e:
+        logger.error(e)
+        return False
+    except Exception as e:
+        logger.error(e)
+        return False
+
+
+# -----------------
+# speed.py
+# -----------------
+
+
+async def consume_rate_tokens(
+    session: AsyncSession,
+    bucket_key: str,
+    rate: float,
+    capacity: float,
+    cost: float = 1,
+    now: Optional[float] = None,
+) -> bool:
+    """
+    原子令牌桶：一条条件 UPDATE 完成补充与扣减（多进程并发安全），
+    更新不到行时尝试插入一个扣减后的满桶；插入被忽略说明桶已存在且令牌不足。
+    """
+    if cost > capacity:
+        return False
+    if now is None:
+        now = time.time()
+
+    refilled = RateLimitBucket.tokens + (now - RateLimitBucket.refilled_at) * rate
+    available = case((refilled > capacity, capacity), else_=refilled)
+    try:
+        result = await session.execute(
+            update(RateLimitBucket)
+            .where(RateLimitBucket.bucket_key == bucket_key, available >= cost)
+            .values(tokens=available - cost, refilled_at=now)
+            .execution_options(synchronize_session=False)
+        )
+        if result.rowcount:
+            await session.commit()
+            return True
+
+        created = datetime.utcnow()
+        row = {
+            "bucket_key": bucket_key,
+            "tokens": capacity - cost,
+            "refilled_at": now,
+            "created_at": created,
+            "updated_at": created,
+        }
+        stmt = build_insert_ignore(
+            get_dialect_name(session), RateLimitBucket, [row], ("bucket_key",)
+        )
+        if stmt is None:
+            existing = await session.execute(
+                select(RateLimitBucket.id).where(RateLimitBucket.bucket_key == bucket_key)
+            )
+            if existing.scalar_one_or_none() is not None:
+                return False
+            stmt = insert(RateLimitBucket).values(row)
+        result = await session.execute(stmt)
+        await session.commit()
+        return bool(result.rowcount)
+    except SQLAlchemyError as e:
+        await session.rollback()
+        logger.error(e)
+        # 限流存储故障时放行，避免整个机器人不可用
+        return True
+    except Exception as e:
+        await session.rollback()
+        logger.error(e)
+        return True
+
+
+async def prune_rate_buckets(session: AsyncSession, before: float) -> int:
+    """删除 before（epoch 秒）之后未再访问的令牌桶"""
+    try:
+        result = await session.execute(
+            delete(RateLimitBucket).where(RateLimitBucket.refilled_at < before)
+        )
+        await session.commit()
+        return result.rowcount
+    except SQLAlchemyError as e:
+        await session.rollback()
+        logger.error(e)
+        return 0
+    except Exception as e:
+        await session.rollback()
+        logger.error(e)
+        return 0
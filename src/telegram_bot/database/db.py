@@ -1,9 +1,11 @@
 import os
 import json
-from sqlalchemy import text
+import threading
+import time
+from sqlalchemy import event, inspect, text
 from sqlalchemy.ext.asyncio import AsyncSession, create_async_engine
 from sqlalchemy.orm import sessionmaker
-from sqlalchemy.pool import NullPool
+from sqlalchemy.pool import AsyncAdaptedQueuePool, NullPool
 from telegram_bot.config import DB_PATH
 from ..config import JSON_DIR
 from .models import Base
@@ -35,10 +37,151 @@ def build_database_url(config: dict) -> str:
     else:
         raise ValueError("Unsupported DB type")
 
+
+# 各数据库默认连接池参数，可被 db.json 中的 "pool" 配置覆盖
+# SQLite 为本地文件，连接成本低且写入串行，池子保持较小即可
+DEFAULT_POOL_OPTIONS = {
+    "sqlite": {
+        "pool_size": 5,
+        "max_overflow": 0,
+        "pool_timeout": 30,
+        "pool_recycle": -1,
+        "pool_pre_ping": False,
+    },
+    "postgresql": {
+        "pool_size": 10,
+        "max_overflow": 20,
+        "pool_timeout": 30,
+        "pool_recycle": 1800,
+        "pool_pre_ping": True,
+    },
+    "mysql": {
+        "pool_size": 10,
+        "max_overflow": 20,
+        "pool_timeout": 30,
+        # MySQL 默认 wait_timeout 为 8 小时，提前回收避免拿到已断开的连接
+        "pool_recycle": 3600,
+        "pool_pre_ping": True,
+    },
+}
+
+
+def build_pool_options(config: dict) -> dict:
+    """
+    合并默认值与 db.json 中的连接池配置。
+    db.json 示例：
+    {
+        "db_type": "postgresql",
+        "pool": {
+            "postgresql": {"pool_size": 20, "max_overflow": 10},
+            "enabled": true
+        }
+    }
+    "enabled": false 时退回 NullPool（每次会话新建连接）。
+    """
+    db_type = config["db_type"]
+    pool_config = config.get("pool", {})
+    if not pool_config.get("enabled", True):
+        return {"poolclass": NullPool}
+
+    options = dict(DEFAULT_POOL_OPTIONS.get(db_type, {}))
+    options.update(pool_config.get(db_type, {}))
+    options["poolclass"] = MeteredQueuePool
+    return options
+
+
+class PoolMetrics:
+    """连接池统计：签出次数、等待耗时、新建连接数、当前/峰值占用"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self._lock:
+            self.connects = 0
+            self.checkouts = 0
+            self.checkins = 0
+            self.invalidated = 0
+            self.checked_out = 0
+            self.peak_checked_out = 0
+            self.wait_total = 0.0
+            self.wait_max = 0.0
+
+    def record_wait(self, seconds: float):
+        with self._lock:
+            self.wait_total += seconds
+            self.wait_max = max(self.wait_max, seconds)
+
+    def on_connect(self):
+        with self._lock:
+            self.connects += 1
+
+    def on_checkout(self):
+        with self._lock:
+            self.checkouts += 1
+            self.checked_out += 1
+            self.peak_checked_out = max(self.peak_checked_out, self.checked_out)
+
+    def on_checkin(self):
+        with self._lock:
+            self.checkins += 1
+            self.checked_out = max(self.checked_out - 1, 0)
+
+    def on_invalidate(self):
+        with self._lock:
+            self.invalidated += 1
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            avg_wait = self.wait_total / self.checkouts if self.checkouts else 0.0
+            return {
+                "connects": self.connects,
+                "checkouts": self.checkouts,
+                "checkins": self.checkins,
+                "invalidated": self.invalidated,
+                "checked_out": self.checked_out,
+                "peak_checked_out": self.peak_checked_out,
+                "avg_wait_ms": round(avg_wait * 1000, 3),
+                "max_wait_ms": round(self.wait_max * 1000, 3),
+            }
+
+
+POOL_METRICS = PoolMetrics()
+
+
+class MeteredQueuePool(AsyncAdaptedQueuePool):
+    """在取连接时计时，统计等待空闲连接（或新建连接）所花的时间"""
+
+    def _do_get(self):
+        start = time.perf_counter()
+        try:
+            return super()._do_get()
+        finally:
+            POOL_METRICS.record_wait(time.perf_counter() - start)
+
+
+def _install_pool_listeners(sync_engine):
+    event.listen(sync_engine, "connect", lambda *args: POOL_METRICS.on_connect())
+    event.listen(sync_engine, "checkout", lambda *args: POOL_METRICS.on_checkout())
+    event.listen(sync_engine, "checkin", lambda *args: POOL_METRICS.on_checkin())
+    event.listen(sync_engine, "invalidate", lambda *args: POOL_METRICS.on_invalidate())
+
+
+def get_pool_stats() -> dict:
+    """返回连接池当前状态与累计指标"""
+    stats = POOL_METRICS.snapshot()
+    stats["status"] = engine.pool.status()
+    return stats
+
+
 config = load_db_config()
 DATABASE_URL = build_database_url(config)
 
-engine = create_async_engine(DATABASE_URL, echo=False, future=True, poolclass=NullPool)
+engine = create_async_engine(
+    DATABASE_URL, echo=False, future=True, **build_pool_options(config)
+)
+_install_pool_listeners(engine.sync_engine)
 async_session = sessionmaker(bind=engine, class_=AsyncSession, expire_on_commit=False)
 
 
@@ -48,6 +191,35 @@ async def init_db():
         if DATABASE_URL.startswith("sqlite"):
             await conn.execute(text("PRAGMA journal_mode=WAL"))
         await conn.run_sync(Base.metadata.create_all)
+        await conn.run_sync(_add_missing_columns)
+        await conn.run_sync(_create_missing_indexes)
+
+
+def _add_missing_columns(sync_conn):
+    # create_all 不会给已存在的表加列，这里补齐后续新增的可空列
+    inspector = inspect(sync_conn)
+    preparer = sync_conn.dialect.identifier_preparer
+    for table in Base.metadata.sorted_tables:
+        if not inspector.has_table(table.name):
+            continue
+        existing = {col["name"] for col in inspector.get_columns(table.name)}
+        for column in table.columns:
+            if column.name in existing or not column.nullable:
+                continue
+            col_type = column.type.compile(dialect=sync_conn.dialect)
+            sync_conn.execute(
+                text(
+                    f"ALTER TABLE {preparer.quote(table.name)} "
+                    f"ADD COLUMN {preparer.quote(column.name)} {col_type}"
+                )
+            )
+
+
+def _create_missing_indexes(sync_conn):
+    # create_all 不会给已存在的表补建索引，这里逐个检查补齐
+    for table in Base.metadata.sorted_tables:
+        for index in table.indexes:
+            index.create(sync_conn, checkfirst=True)
 
 
 def async_session_decorator(func):
@@ -4,6 +4,7 @@ from sqlalchemy import (
     Boolean,
     Column,
     DateTime,
+    Float,
     ForeignKey,
     Index,
     Integer,
@@ -48,7 +49,10 @@ class Membership(BaseModel):
     version = Column(Integer, default=0, nullable=False)
 
     subscription = relationship("Subscription", back_populates="memberships")
-    __table_args__ = (Index("idx_user_end_time", "user_id", "end_time"),)
+    __table_args__ = (
+        Index("idx_user_end_time", "user_id", "end_time"),
+        Index("idx_end_time_id", "end_time", "id"),
+    )
 
 class MembershipLog(BaseModel):
     __tablename__ = "membership_logs"
@@ -77,6 +81,7 @@ class ChannelConfig(BaseModel):
     is_vip_channel = Column(Boolean, default=True, nullable=False)
     bot_joined = Column(Boolean, default=False, nullable=False)
     last_member_fetch_at = Column(DateTime)
+    member_hash = Column(String(64))  # 上次同步的成员快照摘要，未变化时跳过比对
     remark = Column(String(255))
     __table_args__ = (Index("idx_channel_vip", "channel_url"),)
 
@@ -91,11 +96,50 @@ class GroupMember(BaseModel):
     is_bot = Column(Boolean, default=False)
     is_deleted = Column(Boolean, default=False)
     cached_at = Column(DateTime, default=datetime.utcnow)
+    left_at = Column(DateTime)  # 同步时发现已退群的时间，为空表示仍在群内
     __table_args__ = (
         UniqueConstraint("channel_id", "user_id", name="uq_channel_user"),
         Index("idx_channel_user", "channel_id", "user_id"),
+        Index("idx_member_user", "user_id"),
     )
 
+class MemberChannelStat(BaseModel):
+    __tablename__ = "member_channel_stats"
+    id = Column(Integer, primary_key=True, autoincrement=True)
+    user_id = Column(BigInteger, unique=True, nullable=False)
+    username = Column(String(100))
+    first_name = Column(String(100))
+    channel_count = Column(Integer, default=0, nullable=False)
+    __table_args__ = (Index("idx_stat_count_user", "channel_count", "user_id"),)
+
+class CacheVersion(BaseModel):
+    __tablename__ = "cache_versions"
+    id = Column(Integer, primary_key=True, autoincrement=True)
+    name = Column(String(50), unique=True, nullable=False)
+    version = Column(Integer, default=0, nullable=False)
+
+class RateLimitBucket(BaseModel):
+    __tablename__ = "rate_limit_buckets"
+    id = Column(Integer, primary_key=True, autoincrement=True)
+    bucket_key = Column(String(64), unique=True, nullable=False)
+    # tokens 必须排在 refilled_at 之前：MySQL 按列顺序依次赋值，计算令牌时要用旧的 refilled_at
+    tokens = Column(Float, nullable=False)
+    refilled_at = Column(Float, nullable=False)  # 上次补充令牌的时间（epoch 秒）
+    __table_args__ = (Index("idx_bucket_refilled", "refilled_at"),)
+
+class PeerCache(BaseModel):
+    __tablename__ = "peer_cache"
+    id = Column(Integer, primary_key=True, autoincrement=True)
+    lookup_key = Column(String(255), unique=True, nullable=False)
+    peer_type = Column(String(10), nullable=False)
+    peer_id = Column(BigInteger, nullable=False)
+    access_hash = Column(BigInteger)
+    megagroup = Column(Boolean, default=False, nullable=False)
+    detailed = Column(Boolean, default=False, nullable=False)
+    title = Column(String(255))
+    username = Column(String(100))
+    resolved_at = Column(DateTime, default=datetime.utcnow, nullable=False)
+
 class KickLog(BaseModel):
     __tablename__ = "kick_logs"
     id = Column(Integer, primary_key=True, autoincrement=True)
@@ -0,0 +1,98 @@
+from typing import List, Sequence
+
+from sqlalchemy import and_, select, update
+from sqlalchemy.dialects.mysql import insert as mysql_insert
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from sqlalchemy.ext.asyncio import AsyncSession
+
+
+def get_dialect_name(session: AsyncSession) -> str:
+    return session.get_bind().dialect.name
+
+
+def build_upsert(
+    dialect_name: str,
+    model,
+    rows: List[dict],
+    index_elements: Sequence[str],
+    update_columns: Sequence[str],
+):
+    """
+    按数据库方言构造多行 upsert 语句：
+    - sqlite / postgresql: INSERT ... ON CONFLICT (...) DO UPDATE
+    - mysql: INSERT ... ON DUPLICATE KEY UPDATE（依赖唯一索引，index_elements 仅用于其他方言）
+    不支持的方言返回 None。
+    """
+    if dialect_name == "sqlite":
+        stmt = sqlite_insert(model).values(rows)
+        return stmt.on_conflict_do_update(
+            index_elements=list(index_elements),
+            set_={col: stmt.excluded[col] for col in update_columns},
+        )
+    if dialect_name == "postgresql":
+        stmt = pg_insert(model).values(rows)
+        return stmt.on_conflict_do_update(
+            index_elements=list(index_elements),
+            set_={col: stmt.excluded[col] for col in update_columns},
+        )
+    if dialect_name in ("mysql", "mariadb"):
+        stmt = mysql_insert(model).values(rows)
+        return stmt.on_duplicate_key_update(
+            {col: stmt.inserted[col] for col in update_columns}
+        )
+    return None
+
+
+def build_insert_ignore(
+    dialect_name: str, model, rows: List[dict], index_elements: Sequence[str]
+):
+    """按数据库方言构造“冲突则忽略”的插入语句，不支持的方言返回 None"""
+    if dialect_name == "sqlite":
+        return sqlite_insert(model).values(rows).on_conflict_do_nothing(
+            index_elements=list(index_elements)
+        )
+    if dialect_name == "postgresql":
+        return pg_insert(model).values(rows).on_conflict_do_nothing(
+            index_elements=list(index_elements)
+        )
+    if dialect_name in ("mysql", "mariadb"):
+        return mysql_insert(model).values(rows).prefix_with("IGNORE")
+    return None
+
+
+async def upsert_rows(
+    session: AsyncSession,
+    model,
+    rows: List[dict],
+    index_elements: Sequence[str],
+    update_columns: Sequence[str],
+) -> int:
+    """
+    执行多行 upsert（不提交事务），返回处理行数。
+    其他方言退回逐行“先查后写”。
+    """
+    if not rows:
+        return 0
+
+    stmt = build_upsert(
+        get_dialect_name(session), model, rows, index_elements, update_columns
+    )
+    if stmt is not None:
+        await session.execute(stmt)
+        return len(rows)
+
+    for row in rows:
+        key_clause = and_(
+            *(getattr(model, col) == row[col] for col in index_elements)
+        )
+        result = await session.execute(select(model.id).where(key_clause))
+        if result.scalar_one_or_none() is None:
+            session.add(model(**row))
+        else:
+            await session.execute(
+                update(model)
+                .where(key_clause)
+                .values({col: row[col] for col in update_columns})
+            )
+    return len(rows)
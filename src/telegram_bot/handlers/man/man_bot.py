@@ -17,7 +17,6 @@ from telethon.tl.types import (
     Channel,
     ChannelParticipantsAdmins,
     Chat,
-    PeerChannel,
     User,
 )
 
@@ -27,12 +26,15 @@ from telegram_bot.database.crud import (
     delete_admin,
     delete_channel_config,
     get_channel_by_url,
-    list_admins,
     list_channel_configs,
     set_or_get_kick_config,
 )
 from telegram_bot.database.db import async_session
 from telegram_bot.handlers.states import ChannelInfo, ManagerState
+from telegram_bot.scheduler.member_tracker import MEMBER_TRACKER
+from telegram_bot.utils.admin_cache import ADMIN_DIRECTORY
+from telegram_bot.utils.entity_cache import ENTITY_CACHE
+from telegram_bot.utils.speed import rate_policy
 
 from ..button import (
     BOT_BACK_MAN_THIRD,
@@ -268,6 +270,7 @@ async def bot_join_delete(update: Update):
 URL_PATTERN = re.compile(r"(https://t.me/)?([a-zA-Z0-9_]{5,})")
 
 
+@rate_policy(cost=5, scope="admin", concurrency_group="telethon")
 async def bot_join_group(update: Update, context: ContextTypes.DEFAULT_TYPE):
     message = update.message
     if not message or not message.text:
@@ -321,6 +324,7 @@ async def bot_join_group(update: Update, context: ContextTypes.DEFAULT_TYPE):
 
 
 # 添加频道进数据库
+@rate_policy(cost=3, scope="admin", concurrency_group="telethon")
 async def bot_join_db(
     update: Update, context: ContextTypes.DEFAULT_TYPE, group_type=None
 ):
@@ -347,9 +351,9 @@ async def bot_join_db(
             channel_id = None
 
             try:
-                entity = await client.get_entity(channel_url)
-                if isinstance(entity, PeerChannel) or hasattr(entity, "id"):
-                    channel_id = entity.id
+                peer = await ENTITY_CACHE.resolve(client, channel_url)
+                if peer:
+                    channel_id = peer.peer_id
             except UsernameNotOccupiedError:
                 channel_id = None
             except Exception as e:
@@ -366,6 +370,7 @@ async def bot_join_db(
                     bot_joined=False,
                     remark=f"{item.strip()}（{group_type}）",
                 )
+            MEMBER_TRACKER.track(channel_id)
             success.append(f"{channel_url} ✅ 成功添加")
 
         except Exception as e:
@@ -437,6 +442,7 @@ async def bot_man_set(query, context):
     )
 
 
+@rate_policy(cost=2, scope="admin", concurrency_group="telethon")
 async def add_admin_handler(update: Update, context: ContextTypes.DEFAULT_TYPE):
     client = context.bot_data.get("client")
     operator_id = update.effective_user.id
@@ -449,6 +455,8 @@ async def add_admin_handler(update: Update, context: ContextTypes.DEFAULT_TYPE):
 
     level = 1
     success, failed = [], []
+    operator = await ADMIN_DIRECTORY.get(operator_id)
+    operator_level = operator["level"] if operator else None
 
     async with async_session() as session:
         for uid in user_ids:
@@ -456,8 +464,8 @@ async def add_admin_handler(update: Update, context: ContextTypes.DEFAULT_TYPE):
                 user_id = int(uid)
 
                 try:
-                    entity = await client.get_entity(user_id)
-                    username = entity.username if hasattr(entity, "username") else None
+                    peer = await ENTITY_CACHE.resolve(client, user_id)
+                    username = peer.username if peer else None
                 except Exception:
                     username = None
 
@@ -471,10 +479,12 @@ async def add_admin_handler(update: Update, context: ContextTypes.DEFAULT_TYPE):
                         "level": level,
                         "remark": remark,
                     },
+                    operator_level=operator_level,
                 )
                 success.append(f"{user_id} ✅\n\n{msg}")
             except Exception as e:
                 failed.append(f"{uid} ❌ ({str(e)})")
+    ADMIN_DIRECTORY.invalidate()
 
     result = "📋 添加结果：\n"
     if success:
@@ -494,15 +504,20 @@ async def del_admin_handler(update: Update, context: ContextTypes.DEFAULT_TYPE):
         return
 
     success, failed = [], []
+    operator = await ADMIN_DIRECTORY.get(operator_id)
+    operator_level = operator["level"] if operator else None
 
     async with async_session() as session:
         for uid in user_ids:
             try:
                 target_user_id = int(uid)
-                msg = await delete_admin(session, operator_id, target_user_id)
+                msg = await delete_admin(
+                    session, operator_id, target_user_id, operator_level=operator_level
+                )
                 success.append(f"{uid} ✅")
             except Exception as e:
                 failed.append(f"{uid} ❌ ({str(e)})")
+    ADMIN_DIRECTORY.invalidate()
 
     result = "📋 删除结果：\n"
     if success:
@@ -518,8 +533,7 @@ async def list_admins_handler(
     page: int = 1,
     page_size: int = 5,
 ):
-    async with async_session() as session:
-        admin_list = await list_admins(session)
+    admin_list = await ADMIN_DIRECTORY.all()
 
     if not admin_list:
         await update.message.reply_text("暂无管理员。")
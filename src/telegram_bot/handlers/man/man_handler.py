@@ -1,4 +1,6 @@
+import asyncio
 import math
+import time
 from collections import defaultdict
 from copy import deepcopy
 
@@ -7,17 +9,21 @@ from telegram.constants import ParseMode
 from telegram.error import BadRequest
 from telegram.ext import CallbackQueryHandler, CommandHandler, ContextTypes
 from telethon.errors import UserNotParticipantError
-from telethon.tl.functions.channels import GetParticipantsRequest
+from telethon.tl.functions.channels import GetParticipantRequest
 from telethon.tl.functions.messages import GetFullChatRequest
-from telethon.tl.types import Channel, ChannelParticipantsSearch, Chat, User
+from telethon.tl.types import User
 
 from telegram_bot.database.crud import (
-    get_mem_all_chan,
+    count_member_stats,
+    get_member_stats_page,
+    get_user_channel_ids,
     list_channel_configs,
 )
 from telegram_bot.database.db import async_session
 from telegram_bot.handlers.states import ManagerState
+from telegram_bot.utils.entity_cache import ENTITY_CACHE
 from telegram_bot.utils.logger import setup_logger
+from telegram_bot.utils.speed import rate_policy
 
 from ..button import MANAGER_BACK_MENU_FIRST, MANAGER_HANDLE_USER_DETAIL_BUTTON
 
@@ -26,6 +32,16 @@ logger = setup_logger(__name__)
 
 DETAIL_PAGE_SIZE = 10
 
+# 用户群组明细是否对缓存结果逐群实时确认（每群一次 RPC）
+DETAIL_LIVE_VERIFY = False
+# 用户群组明细同时检查的群组数，以及单个群组的超时时间（秒）
+DETAIL_CONCURRENCY = 10
+DETAIL_CHANNEL_TIMEOUT = 10
+
+# 成员统计总人数的缓存时间（秒），聚合表只在成员同步时变化
+STATS_COUNT_TTL = 60
+_stats_count_cache = {"value": None, "expires_at": 0.0}
+
 
 async def hand_page(update: Update, context: ContextTypes.DEFAULT_TYPE):
     query = update.callback_query
@@ -47,8 +63,6 @@ async def hand_page(update: Update, context: ContextTypes.DEFAULT_TYPE):
     print(page_key)
     if page_key == "page_han_chan":
         await get_common_group_stats(update, context, page=page)
-    elif page_key == "page_han_group_detail_":
-        await show_user_group_detail(query, context, page=page)
     else:
         await query.edit_message_text("⚠️ 未知分页指令。")
 
@@ -93,22 +107,41 @@ async def get_valid_group_urls():
         return [c.channel_url for c in configs if c.channel_url]
 
 
+async def get_stats_total(session) -> int:
+    now = time.monotonic()
+    if _stats_count_cache["value"] is None or _stats_count_cache["expires_at"] < now:
+        _stats_count_cache["value"] = await count_member_stats(session)
+        _stats_count_cache["expires_at"] = now + STATS_COUNT_TTL
+    return _stats_count_cache["value"]
+
+
+@rate_policy(cost=2, scope="admin")
 async def get_common_group_stats(update: Update, context, page=1, page_size=10):
     """
-    从数据库中获取所有成员的出现频道统计（分页）
+    从 member_channel_stats 聚合表中分页获取成员的出现频道统计
     """
     query = update.callback_query
     try:
         await query.answer()
 
+        # 每页起始游标 {page: (channel_count, user_id)}，翻页时只查询当前页
+        cursors = context.user_data.setdefault("stats_page_cursors", {})
+        if page == 1:
+            cursors.clear()
+
         async with async_session() as session:  # 获取 AsyncSession
-            # 查询所有非 bot、非 deleted 的用户在不同频道的出现次数
-            all_users = await get_mem_all_chan(session)
+            total = await get_stats_total(session)
+            after = cursors.get(page)
+            sliced_users = await get_member_stats_page(
+                session,
+                page_size,
+                after=after,
+                offset=0 if after else (page - 1) * page_size,
+            )
 
-            total = len(all_users)
-            start = (page - 1) * page_size
-            end = start + page_size
-            sliced_users = all_users[start:end]
+            if sliced_users:
+                last = sliced_users[-1]
+                cursors[page + 1] = (last.channel_count, last.user_id)
 
             if not sliced_users:
                 await query.edit_message_text("❌ 没有找到任何用户记录")
@@ -144,59 +177,83 @@ async def get_common_group_stats(update: Update, context, page=1, page_size=10):
         await query.edit_message_text(f"❌ 统计失败：{e}")
 
 
-# 再次确认用户是否仍在群中
+# 再次确认用户是否仍在群中（group 为 CachedPeer）
 async def is_user_in_group(client, group, user_id):
     try:
-        if isinstance(group, Channel):
-            # 超级群处理方式
-            offset = 0
-            while True:
-                participants = await client(
-                    GetParticipantsRequest(
-                        channel=group,
-                        filter=ChannelParticipantsSearch(""),
-                        offset=offset,
-                        limit=100,
-                        hash=0,
-                    )
+        if group.peer_type == "channel":
+            # 超级群处理方式：直接查询单个成员
+            participant = await ENTITY_CACHE.input_user(client, user_id)
+            try:
+                await client(
+                    GetParticipantRequest(channel=group.input_peer, participant=participant)
                 )
-                if not participants.users:
-                    break
-                for user in participants.users:
-                    if user.id == user_id:
-                        return True
-                offset += len(participants.users)
-            return False
-        elif isinstance(group, Chat):
+            except UserNotParticipantError:
+                return False
+            return True
+        elif group.is_chat:
             # 普通群处理方式
-            full_chat = await client(GetFullChatRequest(group.id))
+            full_chat = await client(GetFullChatRequest(group.peer_id))
             for p in full_chat.full_chat.participants.participants:
                 if p.user_id == user_id:
                     return True
             return False
         else:
-            print(f"未知群类型: {group}")
+            logger.warning(f"未知群类型: {group}")
             return False
     except Exception as e:
-        print(f"确认用户 {user_id} 是否在群中失败: {e}")
+        logger.warning(f"确认用户 {user_id} 是否在群中失败: {e}")
         return False
 
 
-# 获取用户加入的所有群组名称
-async def get_user_groups(client, group_urls, user_id):
-    group_names = []
-    for url in group_urls:
-        try:
-            group = await client.get_entity(url)
-            if await is_user_in_group(client, group, user_id):
-                group_names.append(group.title)
-        except Exception as e:
-            logger.warning(f"处理群组 {url} 失败: {e}")
-            continue
-    return group_names
+async def check_user_group(client, url, user_id, channel_ids, verify):
+    """
+    检查单个群组，返回 (url, title, status)
+    status: member / not_member / error
+    """
+    group = await ENTITY_CACHE.resolve(client, url)
+    title = group.title or url
+    if group.peer_id not in channel_ids:
+        return url, title, "not_member"
+    if verify and not await is_user_in_group(client, group, user_id):
+        return url, title, "not_member"
+    return url, title, "member"
+
+
+# 获取用户在各群组中的状态（并发检查，单群超时不影响其他群）
+# 成员关系取自 group_members（由成员同步任务维护），verify=True 时再逐群实时确认
+async def get_user_group_statuses(
+    client,
+    group_urls,
+    user_id,
+    verify=DETAIL_LIVE_VERIFY,
+    concurrency=DETAIL_CONCURRENCY,
+    timeout=DETAIL_CHANNEL_TIMEOUT,
+):
+    async with async_session() as session:
+        channel_ids = await get_user_channel_ids(session, user_id)
+
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def check(url):
+        async with semaphore:
+            try:
+                return await asyncio.wait_for(
+                    check_user_group(client, url, user_id, channel_ids, verify),
+                    timeout,
+                )
+            except asyncio.TimeoutError:
+                logger.warning(f"处理群组 {url} 超时")
+                return url, url, "timeout"
+            except Exception as e:
+                logger.warning(f"处理群组 {url} 失败: {e}")
+                return url, url, "error"
+
+    return await asyncio.gather(*(check(url) for url in group_urls))
 
 
 # 主函数（用于 bot 调用）
+# 逐群查询成员状态，RPC 较多，与其他 Telethon 重操作共享并发上限
+@rate_policy(cost=5, scope="admin", concurrency_group="telethon")
 async def show_user_group_detail(update, context, page=0, page_size=10):
     message = update.message or update.callback_query.message
     query = update.callback_query
@@ -235,11 +292,16 @@ async def show_user_group_detail(update, context, page=0, page_size=10):
             await message.reply_text("⚠️ 暂无任何已配置的频道链接")
             return
 
-        group_names = await get_user_groups(client, group_urls, target_user_id)
+        statuses = await get_user_group_statuses(client, group_urls, target_user_id)
+        group_names = [title for _, title, status in statuses if status == "member"]
+        unchecked = [url for url, _, status in statuses if status in ("timeout", "error")]
         total = len(group_names)
 
         if total == 0:
-            await message.reply_text(f"🔍 用户 {target_user_id} 未加入任何管理群组")
+            text = f"🔍 用户 {target_user_id} 未加入任何管理群组"
+            if unchecked:
+                text += f"\n⚠️ {len(unchecked)} 个群组查询超时或失败，结果可能不完整"
+            await message.reply_text(text)
             return
 
         start = page * page_size
@@ -250,6 +312,8 @@ async def show_user_group_detail(update, context, page=0, page_size=10):
             f"👤 用户 <code>{target_user_id}</code> 加入的群组（第 {page + 1} 页，共 {((total - 1) // page_size) + 1} 页）:"
         ]
         lines += [f"• {title}" for title in sliced]
+        if unchecked:
+            lines.append(f"\n⚠️ {len(unchecked)} 个群组查询超时或失败，结果可能不完整")
 
         nav_buttons = []
         if total > page_size:
@@ -1,4 +1,5 @@
 import re
+import time
 import uuid
 from collections import defaultdict
 from copy import deepcopy
@@ -13,13 +14,16 @@ from telethon.tl.functions.channels import GetParticipantsRequest
 from telethon.tl.types import ChannelParticipantsSearch
 
 from telegram_bot.database.crud import (
-    check_vip_status,
+    count_memberships,
     delete_memberships,
+    get_vip_page,
     process_memberships_by_uuids,
 )
 from telegram_bot.database.db import async_session
 from telegram_bot.database.models import Membership, MembershipLog
 from telegram_bot.handlers.states import ManagerState
+from telegram_bot.scheduler.expiry import EXPIRY_SCHEDULER
+from telegram_bot.utils.speed import rate_policy
 
 from ..button import VIP_BACK_MAN_THIRD, VIP_SELECT_BUTTON
 
@@ -106,6 +110,7 @@ def validate_uuid_list(uuid_list: List[str]) -> bool:
     return True
 
 
+@rate_policy(cost=2, scope="admin")
 async def vip_delete(update: Update) -> None:
     text = update.message.text or ""
     user_id_list = []
@@ -124,11 +129,17 @@ async def vip_delete(update: Update) -> None:
         return
 
     async with async_session() as session:
-        deleted_count = await delete_memberships(session, user_id_list)
+        outcomes = await delete_memberships(session, user_id_list)
+    deleted_count = sum(1 for outcome in outcomes.values() if outcome == "deleted")
+    invalidate_vip_count()
+
+    for user_id in user_id_list:
+        EXPIRY_SCHEDULER.cancel(user_id)
 
     await update.message.reply_text(f"🗑 已删除 {deleted_count} 个用户的会员资格。")
 
 
+@rate_policy(cost=2, scope="admin")
 async def vip_process(update: Update) -> None:
     text = update.message.text or ""
 
@@ -142,14 +153,39 @@ async def vip_process(update: Update) -> None:
     async with async_session() as session:
         result = await process_memberships_by_uuids(session, uuid_list)
 
+        conflicts = []
         if len(result) == 0:
             added = 0
             renewed = 0
         else:
             added = result["added"]
             renewed = result["renewed"]
+            conflicts = result["conflicts"]
+            for user_id, end_time in result["deadlines"].items():
+                EXPIRY_SCHEDULER.schedule(user_id, end_time)
+            invalidate_vip_count()
+
+        text = f"✅ 新增会员 {added} 个，续费会员 {renewed} 个。"
+        if conflicts:
+            text += "\n⚠️ 以下交易因并发冲突未处理，请重试：\n" + "\n".join(conflicts)
+        await update.message.reply_text(text)
+
+
+# 会员总数缓存（秒），开通 / 删除会员时失效
+VIP_COUNT_TTL = 30
+_vip_count_cache = {"value": None, "expires_at": 0.0}
+
 
-        await update.message.reply_text(f"✅ 新增会员 {added} 个，续费会员 {renewed} 个。")
+def invalidate_vip_count():
+    _vip_count_cache["value"] = None
+
+
+async def get_vip_total(session) -> int:
+    now = time.monotonic()
+    if _vip_count_cache["value"] is None or _vip_count_cache["expires_at"] < now:
+        _vip_count_cache["value"] = await count_memberships(session)
+        _vip_count_cache["expires_at"] = now + VIP_COUNT_TTL
+    return _vip_count_cache["value"]
 
 
 async def check_membership_info(
@@ -157,16 +193,27 @@ async def check_membership_info(
 ):
     await query.answer()
 
-    async with async_session() as session:
-        members = await check_vip_status(session)
+    # 每页起始游标 {page: (end_time, id)}，翻页时只查询当前页
+    cursors = context.user_data.setdefault("vip_page_cursors", {})
+    if page == 1:
+        cursors.clear()
 
-    total = len(members)
-    if total == 0:
-        return await query.message.edit_text("❌ 当前没有会员记录。")
+    async with async_session() as session:
+        total = await get_vip_total(session)
+        if total == 0:
+            return await query.message.edit_text("❌ 当前没有会员记录。")
+
+        after = cursors.get(page)
+        sliced = await get_vip_page(
+            session,
+            page_size,
+            after=after,
+            offset=0 if after else (page - 1) * page_size,
+        )
 
-    start = (page - 1) * page_size
-    end = start + page_size
-    sliced = members[start:end]
+    if sliced:
+        last = sliced[-1]
+        cursors[page + 1] = (last.end_time, last.id)
 
     lines = [
         f"📋 <b>会员列表（第 {page} 页，共 {((total - 1) // page_size) + 1} 页）</b>\n"
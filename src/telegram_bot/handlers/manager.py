@@ -4,8 +4,6 @@ from telegram import ForceReply, InlineKeyboardButton, InlineKeyboardMarkup, Upd
 from telegram.constants import ParseMode
 from telegram.ext import CallbackQueryHandler, CommandHandler, ContextTypes
 
-from telegram_bot.database.crud import list_admins
-from telegram_bot.database.db import async_session
 from telegram_bot.handlers.man.man_bot import (
     bot_man_chan,
     bot_man_set,
@@ -20,6 +18,7 @@ from telegram_bot.handlers.man.man_handler import (
     get_common_group_stats,
     group_detail_input,
     hand_page,
+    show_user_group_detail,
 )
 from telegram_bot.handlers.man.man_vip import (
     check_membership_info,
@@ -27,21 +26,17 @@ from telegram_bot.handlers.man.man_vip import (
     handle_manager_vip,
     vip_page,
 )
+from telegram_bot.utils.admin_cache import ADMIN_DIRECTORY
 
 from .button import MANAGER_FIRST_MENU
 
 
-
 async def manager_group(update: Update, context: ContextTypes.DEFAULT_TYPE):
     user = update.effective_user
     user_id = user.id
 
-    # 获取管理员列表（数据库中查）
-    async with async_session() as session:
-        admins = await list_admins(session)
-        admin_ids = {admin["user_id"] for admin in admins}
-
-    if user_id not in admin_ids:
+    # 管理员检查走进程内缓存
+    if not await ADMIN_DIRECTORY.is_admin(user_id):
         return
 
     # 是管理员，显示管理菜单
@@ -114,6 +109,13 @@ def register(application):
     application.add_handler(
         CallbackQueryHandler(vip_page, pattern=r"^page_vip_.*_(prev|next)_\d+$")
     )
+    # 群组明细分页直接进入 show_user_group_detail，按其声明的策略限流
+    application.add_handler(
+        CallbackQueryHandler(
+            show_user_group_detail,
+            pattern=r"^page_han_group_detail_\d+_(prev|next)_\d+$",
+        )
+    )
     application.add_handler(
         CallbackQueryHandler(hand_page, pattern=r"^page_han_.*_(prev|next)_\d+$")
     )
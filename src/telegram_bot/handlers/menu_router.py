@@ -22,6 +22,7 @@ from telegram_bot.utils.logger import setup_logger
 from .account import account
 from .join_group import join_group
 from .language import language_command
+from .manager import manager_group
 from .start import start
 from .states import ManagerState
 from .subscription import subscribe
@@ -30,25 +31,44 @@ from .support import call_support
 logger = setup_logger(__name__)
 
 
+# 菜单 key -> 处理函数，任意语言的菜单文案都会路由到对应处理函数
+MENU_ACTIONS = {
+    "menu.subscribe": subscribe,
+    "menu.account": account,
+    "menu.join_group": join_group,
+    "menu.support": call_support,
+}
+
+# 固定的英文文本别名
+TEXT_ALIASES = {
+    "subscribe": subscribe,
+    "account": account,
+    "start": start,
+    "manager": manager_group,
+    "language": language_command,
+}
+
+_text_routes = {"version": None, "routes": {}}
+
+
+def get_text_routes() -> dict:
+    """文案 -> 处理函数的反向索引，语言文件重新加载后自动重建"""
+    if _text_routes["version"] != I18n.version or not _text_routes["routes"]:
+        routes = dict(TEXT_ALIASES)
+        for text, key in I18n.reverse_index("menu").items():
+            if key in MENU_ACTIONS:
+                routes[text] = MENU_ACTIONS[key]
+        _text_routes["routes"] = routes
+        _text_routes["version"] = I18n.version
+    return _text_routes["routes"]
+
+
 async def router(update, context):
     text = update.message.text.strip()
-    user_id = update.effective_user.id
-    lang = context.user_data.get("lang", user_id)
-
-    if text in [I18n.t(lang, "menu.subscribe"), "subscribe"]:
-        await subscribe(update, context)
-    elif text in [I18n.t(lang, "menu.account"), "account"]:
-        await account(update, context)
-    elif text in [I18n.t(lang, "menu.join_group")]:
-        await join_group(update, context)
-    elif text in [I18n.t(lang, "menu.support")]:
-        await call_support(update, context)
-    elif text in ["start"]:
-        await start(update, context)
-    elif text in ["manager"]:
-        await manager_group(update, context)
-    elif text in ["language"]:
-        await language_command(update, context)
+
+    handler = get_text_routes().get(text)
+    if handler:
+        await handler(update, context)
     else:
         logger.info("⚠️ 无效菜单选项")
 
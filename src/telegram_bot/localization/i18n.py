@@ -2,12 +2,83 @@
 
 import json
 import os
+from string import Formatter
 
 from telegram_bot.config import JSON_DIR
 
+_FORMATTER = Formatter()
+_CONVERSIONS = {"r": repr, "s": str, "a": ascii}
+
+
+class _Template:
+    """预解析的格式化字符串：literal 与字段交替存放，渲染时不再解析"""
+
+    __slots__ = ("raw", "parts")
+
+    def __init__(self, raw: str, parts: list):
+        self.raw = raw
+        self.parts = parts
+
+    def render(self, kwargs: dict) -> str:
+        try:
+            out = []
+            for literal, name, spec, conversion in self.parts:
+                out.append(literal)
+                if name is not None:
+                    value = kwargs[name]
+                    if conversion:
+                        value = _CONVERSIONS[conversion](value)
+                    out.append(format(value, spec))
+            return "".join(out)
+        except Exception:
+            return self.raw
+
+
+class _FormatFallback:
+    """含位置参数、属性访问或嵌套格式的字符串，仍交给 str.format 处理"""
+
+    __slots__ = ("raw",)
+
+    def __init__(self, raw: str):
+        self.raw = raw
+
+    def render(self, kwargs: dict) -> str:
+        try:
+            return self.raw.format(**kwargs)
+        except Exception:
+            return self.raw
+
+
+def _compile(value: str):
+    """
+    无字段的字符串直接返回（预先处理 {{ }} 转义），
+    只含简单命名字段的编译成 _Template，其余退回 str.format
+    """
+    try:
+        parsed = list(_FORMATTER.parse(value))
+    except ValueError:
+        # 花括号不成对，str.format 必然失败，原样返回
+        return value
+
+    if all(name is None for _, name, _, _ in parsed):
+        return "".join(literal for literal, _, _, _ in parsed)
+
+    for _, name, spec, _ in parsed:
+        if name is not None and (
+            not name.isidentifier() or "{" in (spec or "")
+        ):
+            return _FormatFallback(value)
+    return _Template(value, parsed)
+
 
 class I18n:
     _locales = {}
+    # (lang, "a.b.c") -> 编译后的值：str（无参数，直接返回）/ _Template / dict 等原值
+    _table = {}
+    # prefix -> {文案: key}，按文案反查菜单项，重新加载语言文件时清空
+    _reverse = {}
+    # 每次加载语言文件 +1，依赖翻译结果的缓存据此判断是否需要重建
+    version = 0
 
     @classmethod
     def load_locales(cls):
@@ -16,6 +87,39 @@ class I18n:
         if os.path.exists(path):
             with open(path, "r", encoding="utf-8") as f:
                 cls._locales = json.load(f)
+        cls._table = cls._build_table(cls._locales)
+        cls._reverse = {}
+        cls.version += 1
+
+    @staticmethod
+    def _build_table(locales: dict) -> dict:
+        table = {}
+
+        def walk(lang, prefix, value):
+            if prefix:
+                table[(lang, prefix)] = _compile(value) if isinstance(value, str) else value
+            if isinstance(value, dict):
+                for key, child in value.items():
+                    walk(lang, f"{prefix}.{key}" if prefix else key, child)
+
+        for lang, tree in locales.items():
+            walk(lang, "", tree)
+        return table
+
+    @classmethod
+    def reverse_index(cls, prefix: str) -> dict:
+        """返回 prefix 下所有语言无参数文案的 {文案: key}（同一文案取先出现的 key）"""
+        if not cls._locales:
+            cls.load_locales()
+
+        index = cls._reverse.get(prefix)
+        if index is None:
+            index = {}
+            for (_, key), value in cls._table.items():
+                if isinstance(value, str) and key.startswith(prefix + "."):
+                    index.setdefault(value.strip(), key)
+            cls._reverse[prefix] = index
+        return index
 
     @classmethod
     def t(cls, lang: str, key_path: str, **kwargs) -> str:
@@ -26,17 +130,9 @@ class I18n:
         if lang not in cls._locales:
             lang = "zh"
 
-        value = cls._locales.get(lang, {})
-        for key in key_path.split("."):
-            if isinstance(value, dict):
-                value = value.get(key)
-            else:
-                return key_path
-            if value is None:
-                return key_path  # fallback
-        if isinstance(value, str):
-            try:
-                return value.format(**kwargs)
-            except Exception:
-                return value
+        value = cls._table.get((lang, key_path))
+        if value is None:
+            return key_path  # fallback
+        if isinstance(value, (_Template, _FormatFallback)):
+            return value.render(kwargs)
         return value
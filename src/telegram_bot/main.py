@@ -11,7 +11,12 @@ sys.modules["sqlite3"] = pysqlite3
 from telegram.ext import ApplicationBuilder
 from telethon import TelegramClient
 
-from telegram_bot.config import SESSION_FILE
+from telegram_bot.config import (
+    CONCURRENT_UPDATES,
+    WORKER_COUNT,
+    WORKER_INDEX,
+    worker_session_file,
+)
 from telegram_bot.database.db import init_db
 from telegram_bot.handlers import (
     account,
@@ -25,9 +30,11 @@ from telegram_bot.handlers import (
     support,
 )
 from telegram_bot.localization.i18n import I18n
+from telegram_bot.scheduler.expiry import EXPIRY_SCHEDULER
 from telegram_bot.scheduler.jobs import setup_scheduler
+from telegram_bot.scheduler.member_tracker import MEMBER_TRACKER
 from telegram_bot.utils.logger import setup_logger
-from telegram_bot.utils.speed import rate_limit_wrapper
+from telegram_bot.utils.speed import PerUserUpdateProcessor, rate_limit_wrapper
 #asyncio.get_event_loop().set_debug(True)
 # logger = setup_logger(__name__)
 #logging.basicConfig(level=logging.DEBUG)
@@ -36,13 +43,16 @@ I18n.load_locales()
 API_ID = os.environ.get("API_ID")
 API_HASH = os.environ.get("API_HASH")
 BOT_TOKEN = os.environ.get("BOT_TOKEN")
-TELETHON_SESSION = SESSION_FILE
+TELETHON_SESSION = worker_session_file(WORKER_INDEX)
 client = TelegramClient(TELETHON_SESSION, API_ID, API_HASH)
 
 
 def wrap_all_han(application):
     for handler in application.handlers[0]:
         o_call = handler.callback
+        # 已通过 @rate_policy 声明策略的处理器不再套默认限流
+        if getattr(o_call, "rate_policy", None) is not None:
+            continue
         if inspect.iscoroutinefunction(o_call):
             handler.callback = rate_limit_wrapper(o_call)
 
@@ -50,42 +60,66 @@ def wrap_all_han(application):
 async def on_startup(application):
     await init_db()
     await menu_commands.setup_commands(application)
+    if WORKER_COUNT > 1:
+        # worker 进程没有终端，不能交互登录，会话需事先登录好
+        await client.connect()
+        if not await client.is_user_authorized():
+            raise RuntimeError(
+                f"Telethon 会话未登录: {TELETHON_SESSION}，"
+                f"请先运行 python -m telegram_bot.webhook --login {WORKER_INDEX}"
+            )
     await client.start()
     application.bot_data["client"] = client
     # logger.info("Telethon 客户端已启动")
-    await setup_scheduler(application)
+    # 多 worker 时定时任务、到期踢人与实时成员跟踪只在 0 号 worker 运行
+    if WORKER_INDEX == 0:
+        await setup_scheduler(application)
 
 
 async def on_shutdown(application):
+    await EXPIRY_SCHEDULER.stop()
+    await MEMBER_TRACKER.stop()
     await client.disconnect()
     # logger.info("Telethon 客户端已断开")
 
 
+def build_application(updater: bool = True):
+    """
+    构建并注册所有处理器。updater=False 用于 webhook 模式（更新由 HTTP 推送，
+    不需要轮询用的 Updater，post_init / post_shutdown 由调用方自行执行）。
+    """
+    builder = (
+        ApplicationBuilder()
+        .token(BOT_TOKEN)
+        .concurrent_updates(PerUserUpdateProcessor(CONCURRENT_UPDATES))
+    )
+    if updater:
+        builder = builder.post_init(on_startup).post_shutdown(on_shutdown)
+    else:
+        builder = builder.updater(None)
+    application = builder.build()
+
+    # 注册模块
+    modules = [
+        start,
+        subscription,
+        language,
+        join_group,
+        account,
+        menu_router,
+        support,
+        manager,
+    ]
+    for module in modules:
+        module.register(application)
+
+    wrap_all_han(application)
+    return application
+
+
 def main():
     try:
-        application = (
-            ApplicationBuilder()
-            .token(BOT_TOKEN)
-            .post_init(on_startup)
-            .post_shutdown(on_shutdown)
-            .build()
-        )
-
-        # 注册模块
-        modules = [
-            start,
-            subscription,
-            language,
-            join_group,
-            account,
-            menu_router,
-            support,
-            manager,
-        ]
-        for module in modules:
-            module.register(application)
-
-        wrap_all_han(application)
+        application = build_application()
 
         # logger.info("🤖 Bot 启动中...")
         application.run_polling()
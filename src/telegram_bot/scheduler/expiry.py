@@ -0,0 +1,144 @@
+import asyncio
+import heapq
+from datetime import datetime, timedelta
+
+from telegram_bot.database.crud import get_membership_deadlines
+from telegram_bot.database.db import async_session
+from telegram_bot.utils.logger import setup_logger
+
+logger = setup_logger(__name__)
+
+
+class ExpiryScheduler:
+    """
+    会员到期调度器：未封禁会员的 end_time 放在最小堆里，到点触发踢人，
+    续费 / 删除时通过 schedule() / cancel() 增量更新，不再定时全表扫描。
+
+    batch_window（秒）为两次踢人批次的最小间隔：空闲时到期即踢，
+    短时间内大量到期时合并成一批处理。
+    """
+
+    def __init__(self, batch_window: int = 60):
+        self.batch_window = batch_window
+        self.on_expire = None  # async callable(user_ids)
+        self.forward = None  # 多 worker 时非 0 号 worker 把变更转给 0 号 worker：forward(方法名, *参数)
+        self._heap = []  # (end_time, user_id)
+        self._deadlines = {}  # user_id -> end_time，堆中与之不一致的条目视为已失效
+        self._wakeup = asyncio.Event()
+        self._task = None
+        self._last_fire = None
+        self._in_flight = set()  # 已出堆、正在踢出的会员
+
+    def __len__(self):
+        return len(self._deadlines)
+
+    def schedule(self, user_id: int, end_time: datetime):
+        """新增或更新会员的到期时间"""
+        if self.forward:
+            self.forward("schedule", user_id, end_time)
+            return
+        self._deadlines[user_id] = end_time
+        heapq.heappush(self._heap, (end_time, user_id))
+        self._wakeup.set()
+
+    def cancel(self, user_id: int):
+        """会员被删除 / 封禁后取消其到期任务（堆中条目惰性清理）"""
+        if self.forward:
+            self.forward("cancel", user_id)
+            return
+        if self._deadlines.pop(user_id, None) is not None:
+            self._wakeup.set()
+
+    async def reload(self):
+        """
+        从数据库重新加载全部到期时间（启动时及每日兜底校准）。
+        正在踢出的会员尚未写入封禁状态，跳过它们以免被重新排期、重复踢出。
+        """
+        skip = set(self._in_flight)
+        async with async_session() as session:
+            rows = await get_membership_deadlines(session)
+        skip |= self._in_flight
+
+        rows = [(user_id, end_time) for user_id, end_time in rows if user_id not in skip]
+        self._deadlines = {user_id: end_time for user_id, end_time in rows}
+        self._heap = [(end_time, user_id) for user_id, end_time in rows]
+        heapq.heapify(self._heap)
+        self._wakeup.set()
+        logger.info(f"⏱ 已加载 {len(self._deadlines)} 个会员到期时间")
+
+    def start(self, on_expire):
+        self.on_expire = on_expire
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    def _peek(self):
+        # 丢弃已被更新或取消的条目
+        while self._heap:
+            end_time, user_id = self._heap[0]
+            if self._deadlines.get(user_id) == end_time:
+                return end_time
+            heapq.heappop(self._heap)
+        return None
+
+    def _pop_due(self, now: datetime) -> list:
+        due = []
+        while True:
+            end_time = self._peek()
+            if end_time is None or end_time > now:
+                return due
+            _, user_id = heapq.heappop(self._heap)
+            del self._deadlines[user_id]
+            due.append(user_id)
+
+    async def _sleep_until(self, when: datetime):
+        delay = (when - datetime.utcnow()).total_seconds()
+        if delay <= 0:
+            return
+        try:
+            # 有新的到期时间加入时提前唤醒，重新计算
+            await asyncio.wait_for(self._wakeup.wait(), timeout=delay)
+        except asyncio.TimeoutError:
+            pass
+
+    async def _run(self):
+        while True:
+            self._wakeup.clear()
+            next_time = self._peek()
+            if next_time is None:
+                await self._wakeup.wait()
+                continue
+
+            if self._last_fire:
+                next_time = max(
+                    next_time, self._last_fire + timedelta(seconds=self.batch_window)
+                )
+            if next_time > datetime.utcnow():
+                await self._sleep_until(next_time)
+                continue
+
+            now = datetime.utcnow()
+            user_ids = self._pop_due(now)
+            if not user_ids:
+                continue
+
+            self._last_fire = now
+            self._in_flight = set(user_ids)
+            try:
+                await self.on_expire(user_ids)
+            except Exception:
+                logger.exception(f"❌ 处理到期会员失败: {len(user_ids)} 人")
+            finally:
+                self._in_flight = set()
+
+
+# 进程内唯一的到期调度器，续费 / 删除会员的处理器直接更新它
+EXPIRY_SCHEDULER = ExpiryScheduler()
@@ -1,4 +1,9 @@
+import asyncio
+import hashlib
+import time
+from collections import deque
 from datetime import datetime, timedelta
+from typing import NamedTuple, Optional
 
 from apscheduler.schedulers.asyncio import AsyncIOScheduler
 from telegram.error import Forbidden
@@ -10,73 +15,162 @@ from telethon.errors import (
 )
 from telethon.tl.functions.channels import EditBannedRequest, GetParticipantsRequest
 from telethon.tl.functions.messages import DeleteChatUserRequest, GetFullChatRequest
-from telethon.tl.types import Channel, ChannelParticipantsSearch, Chat, ChatBannedRights
+from telethon.tl.types import (
+    ChannelParticipantsAdmins,
+    ChannelParticipantsRecent,
+    ChannelParticipantsSearch,
+    ChatBannedRights,
+    User,
+)
 
+from telegram_bot.config import WORKER_COUNT
 from telegram_bot.database.crud import (
+    apply_member_diff,
+    count_member_stats,
     fetch_config_group,
+    get_channel_member_ids,
+    get_channel_members,
     get_expired_memberships,
     get_expiring_soon_memberships,
     get_kick_setting,
+    get_membership_deadlines,
     get_vip_channels,
-    record_kick,
+    rebuild_member_stats,
+    record_kicks_bulk,
     recover_ban,
-    save_chan_mem,
+    refresh_member_stats,
     set_ban_members,
     update_config_time,
 )
-from telegram_bot.database.db import async_session
+from telegram_bot.database.db import async_session, get_pool_stats
+from telegram_bot.scheduler.expiry import EXPIRY_SCHEDULER
+from telegram_bot.scheduler.member_tracker import MEMBER_TRACKER
+from telegram_bot.utils.entity_cache import ENTITY_CACHE
+from telegram_bot.utils.flood import FLOOD_GATE
 from telegram_bot.utils.logger import setup_logger
+from telegram_bot.utils.settings_cache import KICK_SETTINGS
+from telegram_bot.utils.speed import ADMIN_RATE_LIMITER, RATE_LIMITER
 
 logger = setup_logger(__name__)
 
+# 踢人任务同时进行的 Telegram 请求数
+KICK_CONCURRENCY = 8
+
+# 成员同步同时处理的群组数，以及群组多久未抓取才重新同步（分钟）
+SYNC_WORKERS = 4
+SYNC_STALE_MINUTES = 60
 
-async def kick_user_from_group(client, channel_id: int, user_id: int):
+# 抓取超级群成员时每页的人数（Telegram 单页上限 200）
+PARTICIPANT_PAGE_SIZE = 200
+
+# 成员超过搜索上限时用于分片搜索的前缀字符，以及前缀的最大长度
+SEARCH_SHARD_ALPHABET = "abcdefghijklmnopqrstuvwxyz0123456789_"
+SEARCH_SHARD_MAX_DEPTH = 3
+# 没有用户名、显示名为中文的成员匹配不到拉丁前缀，再按常见姓氏 / 首字各搜一次（不细分）
+SEARCH_SHARD_CJK_INITIALS = (
+    "王李张刘陈杨黄赵吴周徐孙马朱胡郭何林罗高郑梁谢宋唐许韩冯邓曹彭曾肖田"
+    "董袁潘于蒋蔡余杜叶程苏魏吕丁任沈姚卢姜崔钟谭陆汪范金石廖贾夏韦付方白"
+    "邹孟熊秦邱江尹薛闫段雷侯龙史陶黎贺顾毛郝龚邵万钱严覃武戴莫孔向汤小大阿"
+)
+# 连续这么多个分片都没有新成员时视为分片已饱和，停止继续搜索
+SEARCH_SHARD_MAX_STALL = 40
+
+
+async def kick_from_entity(client, peer, user_id: int) -> bool:
     """
-    自动判断群类型并踢人，兼容频道/超级群/普通群
+    在已解析的群（CachedPeer）中踢人，异常向上抛出由调用方处理
     """
-    try:
-        entity = await client.get_entity(channel_id)
-
-        if isinstance(entity, Channel) and entity.megagroup:
-            # 超级群 / 频道
-            participant = await client.get_input_entity(user_id)
-            await client(
-                EditBannedRequest(
-                    channel=entity,
-                    participant=participant,
-                    banned_rights=ChatBannedRights(until_date=None, view_messages=True),
-                )
+    if peer.is_megagroup:
+        # 超级群 / 频道
+        participant = await ENTITY_CACHE.input_user(client, user_id)
+        await client(
+            EditBannedRequest(
+                channel=peer.input_peer,
+                participant=participant,
+                banned_rights=ChatBannedRights(until_date=None, view_messages=True),
             )
-            logger.info(f"✅ 已踢出用户 {user_id} 从超级群 {channel_id}")
-
-        elif isinstance(entity, Chat):
-            # 普通群
-            user = await client.get_input_entity(user_id)
-            await client(
-                DeleteChatUserRequest(
-                    chat_id=entity.id, user_id=user, revoke_history=True
-                )
+        )
+        logger.info(f"✅ 已踢出用户 {user_id} 从超级群 {peer.peer_id}")
+        return True
+
+    if peer.is_chat:
+        # 普通群
+        user = await ENTITY_CACHE.input_user(client, user_id)
+        await client(
+            DeleteChatUserRequest(chat_id=peer.peer_id, user_id=user, revoke_history=True)
+        )
+        logger.info(f"✅ 已踢出用户 {user_id} 从普通群 {peer.peer_id}")
+        return True
+
+    logger.error(f"❌ 未知群类型: {peer.peer_type}")
+    return False
+
+
+async def resolve_channel_entities(client, channels) -> dict:
+    """
+    每个频道只解析一次实体（经实体缓存），返回 {channel_id: CachedPeer}
+    """
+    entities = {}
+    for channel in channels:
+        try:
+            entities[channel.channel_id] = await ENTITY_CACHE.resolve_chat(
+                client, channel.channel_id
             )
-            logger.info(f"✅ 已踢出用户 {user_id} 从普通群 {channel_id}")
+        except ChannelPrivateError:
+            logger.error(f"❌ 无法访问频道 {channel.channel_id}")
+        except Exception as e:
+            logger.error(f"❌ 解析频道 {channel.channel_id} 失败: {e}")
+    return entities
 
-        else:
-            logger.error(f"❌ 未知群类型: {type(entity)}")
 
-    except UserNotParticipantError:
-        logger.warning(f"⚠️ 用户 {user_id} 不在群组 {channel_id}")
-    except UserAdminInvalidError:
-        logger.error(f"❌ 没有权限踢出用户 {user_id}（需要管理权限）")
-    except Exception as e:
-        logger.error(f"❌ 踢出用户失败: {e}")
+async def run_kick_pipeline(client, entities: dict, user_ids) -> list:
+    """
+    并发踢人（最多 KICK_CONCURRENCY 个请求同时进行，FloodWait 时整体退避），
+    返回成功踢出的 (user_id, channel_id) 列表
+    """
+    semaphore = asyncio.Semaphore(KICK_CONCURRENCY)
+
+    async def kick_one(channel_id, entity, user_id):
+        async with semaphore:
+            try:
+                if await FLOOD_GATE.call(kick_from_entity, client, entity, user_id):
+                    return user_id, channel_id
+            except UserNotParticipantError:
+                logger.warning(f"⚠️ 用户 {user_id} 已不在频道 {channel_id} 中")
+            except UserAdminInvalidError:
+                logger.error(f"❌ 没有权限踢出用户 {user_id}（需要管理权限）")
+            except ChannelPrivateError:
+                logger.error(f"❌ 无法访问频道 {channel_id}")
+            except Exception as e:
+                logger.error(f"❌ 踢人失败: {user_id} @ {channel_id} - {e}")
+            return None
+
+    results = await asyncio.gather(
+        *(
+            kick_one(channel_id, entity, user_id)
+            for user_id in user_ids
+            for channel_id, entity in entities.items()
+        )
+    )
+    return [r for r in results if r]
 
 
-async def kick_expired_members(client):
+async def kick_expired_members(client, user_ids=None):
     """
-    自动踢出过期会员的任务
+    自动踢出过期会员的任务，user_ids 为到期调度器给出的候选会员（会再次核对数据库）
     """
     async with async_session() as session:
         # 获取过期会员
-        expired_members = await get_expired_memberships(session)
+        expired_members = await get_expired_memberships(session, user_ids)
+
+        if user_ids is not None:
+            # 调度器出堆时已移除候选会员；已在别处续费的按数据库中的 end_time 重新排期
+            expired_ids = {m.user_id for m in expired_members}
+            renewed = [user_id for user_id in user_ids if user_id not in expired_ids]
+            if renewed:
+                for user_id, end_time in await get_membership_deadlines(session, renewed):
+                    EXPIRY_SCHEDULER.schedule(user_id, end_time)
+
         if not expired_members:
             return
 
@@ -84,46 +178,32 @@ async def kick_expired_members(client):
         vip_channels = await get_vip_channels(session)
         if not vip_channels:
             logger.info("❌ 未找到VIP频道配置")
+            # 候选会员已出堆，放回调度器，下一批次再试
+            for member in expired_members:
+                EXPIRY_SCHEDULER.schedule(member.user_id, member.end_time)
             return
 
         now = datetime.utcnow()
+        start = time.perf_counter()
 
-        for member in expired_members:
-            for channel in vip_channels:
-                try:
-                    # 踢出用户
-                    await kick_user_from_group(
-                        client, channel.channel_id, member.user_id
-                    )
-
-                    # 记录踢出操作
-                    await record_kick(
-                        session,
-                        user_id=member.user_id,
-                        channel_id=channel.channel_id,
-                        kicked_at=now,
-                    )
+        entities = await resolve_channel_entities(client, vip_channels)
+        user_ids = [m.user_id for m in expired_members]
+        kicked = await run_kick_pipeline(client, entities, user_ids)
 
-                    logger.info(
-                        f"✅ 已踢出过期会员 {member.user_id} 从频道 {channel.channel_id}"
-                    )
+        # 记录踢出操作（一次批量写入）
+        await record_kicks_bulk(session, kicked, kicked_at=now)
 
-                except UserNotParticipantError:
-                    logger.warning(
-                        f"⚠️ 用户 {member.user_id} 已不在频道 {channel.channel_id} 中"
-                    )
-                    continue
-                except ChannelPrivateError:
-                    logger.error(f"❌ 无法访问频道 {channel.channel_id}")
-                    continue
-                except Exception as e:
-                    logger.error(f"❌ 踢人失败: {str(e)}")
-                    continue
+        elapsed = time.perf_counter() - start
+        rate = len(kicked) / elapsed if elapsed > 0 else 0
+        logger.info(
+            f"👢 踢出 {len(kicked)} 次（{len(user_ids)} 人 × {len(entities)} 个频道），"
+            f"耗时 {elapsed:.2f}s（{rate:.1f} 次/秒）"
+        )
 
         # 删除过期会员记录
-        if expired_members:
-            await set_ban_members(session, [m.user_id for m in expired_members])
-            logger.info(f"✅ 已删除 {len(expired_members)} 个过期会员记录")
+        outcomes = await set_ban_members(session, user_ids) or {}
+        banned = sum(1 for outcome in outcomes.values() if outcome == "banned")
+        logger.info(f"✅ 已封禁 {banned}/{len(expired_members)} 个过期会员记录")
 
         logger.info(f"🔄 自动踢人任务完成")
 
@@ -166,16 +246,21 @@ async def recover_ban_members(client):
         success_count = 0
         fail_count = 0
 
+        entities = await resolve_channel_entities(client, vip_channels)
+
         for user_id in user_ids:
             for channel in vip_channels:
                 try:
-                    entity = await client.get_entity(channel.channel_id)
+                    peer = entities.get(channel.channel_id)
+                    if peer is None:
+                        fail_count += 1
+                        continue
 
-                    if isinstance(entity, Channel) and entity.megagroup:
-                        participant = await client.get_input_entity(user_id)
+                    if peer.is_megagroup:
+                        participant = await ENTITY_CACHE.input_user(client, user_id)
                         await client(
                             EditBannedRequest(
-                                channel=entity,
+                                channel=peer.input_peer,
                                 participant=participant,
                                 banned_rights=ChatBannedRights(
                                     until_date=None, view_messages=False
@@ -197,85 +282,322 @@ async def recover_ban_members(client):
         logger.info(f"🔁 解禁完成，成功: {success_count} 次，失败: {fail_count} 次")
 
 
-async def fetch_group_participants(client, group):
-    users = []
+class ParticipantRecord(NamedTuple):
+    """群成员的精简记录，只保留写入 group_members 需要的字段"""
+
+    id: int
+    username: Optional[str]
+    first_name: Optional[str]
+    last_name: Optional[str]
+    bot: bool
+    deleted: bool
+
+    @classmethod
+    def from_user(cls, user) -> "ParticipantRecord":
+        return cls(
+            user.id,
+            user.username,
+            user.first_name,
+            user.last_name,
+            bool(user.bot),
+            bool(user.deleted),
+        )
+
+
+async def _search_participants(client, group, participant_filter, page_size: int, stats: dict):
+    """按过滤条件（关键字 / 最近活跃 / 管理员）分页获取超级群成员，逐页产出 (匹配总数, 本页 User 列表)"""
+    offset = 0
+    while True:
+        participants = await FLOOD_GATE.call(
+            client,
+            GetParticipantsRequest(
+                channel=group.input_peer,
+                filter=participant_filter,
+                offset=offset,
+                limit=page_size,
+                hash=0,
+            ),
+        )
+        stats["pages"] += 1
+        if not participants.users:
+            return
+        yield participants.count, participants.users
+        offset += len(participants.users)
+
+
+async def iter_group_participants(
+    client, group, page_size: int = PARTICIPANT_PAGE_SIZE, stats: Optional[dict] = None
+):
+    """
+    按页产出群成员（ParticipantRecord 列表，已去重），group 为 CachedPeer。
+    超级群的空关键字搜索最多返回约 1 万人，成员更多时先补取最近活跃成员与管理员，
+    再按用户名 / 姓名的拉丁前缀分片搜索（命中上限的分片继续细分，最长
+    SEARCH_SHARD_MAX_DEPTH 个字符），并按常见中文首字各搜一次；连续
+    SEARCH_SHARD_MAX_STALL 个分片没有新成员时提前结束。
+    stats 会累计 pages（请求页数）、shards（分片数）、duplicates（去重人数），
+    并在结束时写入 complete（是否取到全部成员）。
+    抓取失败时抛出异常，调用方据此判断快照不完整。
+    """
+    if stats is None:
+        stats = {}
+    for key in ("pages", "shards", "duplicates"):
+        stats.setdefault(key, 0)
+    stats["complete"] = True
+    seen = set()
+
+    def fresh(users):
+        page = []
+        for u in users:
+            if u.id in seen:
+                stats["duplicates"] += 1
+                continue
+            seen.add(u.id)
+            page.append(ParticipantRecord.from_user(u))
+        return page
+
+    if group.peer_type == "channel":
+        total = 0
+        async for count, users in _search_participants(
+            client, group, ChannelParticipantsSearch(""), page_size, stats
+        ):
+            total = count
+            page = fresh(users)
+            if page:
+                yield page
+        if len(seen) >= total:
+            return
+
+        # 成员数超过搜索上限：补取最近活跃成员与管理员，再按前缀分片枚举
+        shards = deque(
+            [ChannelParticipantsRecent(), ChannelParticipantsAdmins()]
+            + list(SEARCH_SHARD_ALPHABET)
+            + list(SEARCH_SHARD_CJK_INITIALS)
+        )
+        stall = 0
+        while shards and len(seen) < total:
+            if stall >= SEARCH_SHARD_MAX_STALL:
+                logger.warning(
+                    f"⚠️ 连续 {stall} 个分片没有新成员，停止分片搜索: {group.peer_id}"
+                )
+                break
+            shard = shards.popleft()
+            stats["shards"] += 1
+            participant_filter = (
+                ChannelParticipantsSearch(shard) if isinstance(shard, str) else shard
+            )
+            before = len(seen)
+            matched = fetched = 0
+            async for count, users in _search_participants(
+                client, group, participant_filter, page_size, stats
+            ):
+                matched = count
+                fetched += len(users)
+                page = fresh(users)
+                if page:
+                    yield page
+            stall = stall + 1 if len(seen) == before else 0
+            if (
+                isinstance(shard, str)
+                and shard.isascii()
+                and fetched < matched
+                and len(shard) < SEARCH_SHARD_MAX_DEPTH
+            ):
+                shards.extend(shard + c for c in SEARCH_SHARD_ALPHABET)
+
+        if len(seen) < total:
+            stats["complete"] = False
+            logger.warning(
+                f"⚠️ 分片搜索后仍缺少成员: {group.peer_id}（{len(seen)}/{total}）"
+            )
+
+    elif group.is_chat:
+        # 普通群的成员资料随 GetFullChatRequest 一并返回，无需逐个 get_entity
+        full_chat = await FLOOD_GATE.call(client, GetFullChatRequest(group.peer_id))
+        stats["pages"] += 1
+        member_ids = {p.user_id for p in full_chat.full_chat.participants.participants}
+        page = fresh(
+            u for u in full_chat.users if isinstance(u, User) and u.id in member_ids
+        )
+        if page:
+            yield page
+
 
+def member_digest(u) -> int:
+    """单个成员（id + 用户名 + 姓名）的摘要"""
+    line = f"{u.id}|{u.username or ''}|{u.first_name or ''}|{u.last_name or ''}"
+    return int.from_bytes(hashlib.sha256(line.encode()).digest()[:16], "big")
+
+
+def member_snapshot_hash(users) -> str:
+    """成员快照摘要：各成员摘要求和，与顺序无关，可按页累加"""
+    return format_snapshot_hash(sum(member_digest(u) for u in users))
+
+
+def format_snapshot_hash(total: int) -> str:
+    return f"{total % (1 << 128):032x}"
+
+
+def changed_members(users, stored: dict) -> list:
+    """返回新加入、重新加入或资料有变化的成员"""
+    return [
+        u
+        for u in users
+        if stored.get(u.id) != (u.username, u.first_name, u.last_name, True)
+    ]
+
+
+async def sync_channel_members(client, group_url, stored_hash):
+    """
+    同步单个群组的成员：按页抓取、比对并写入变化（内存占用与单页大小相当），
+    完成后提交 last_member_fetch_at，中断重跑时已完成的群组会被跳过。
+    每页的读写使用独立的短会话，抓取下一页（含 FloodWait 等待）时不占用数据库连接
+    """
     try:
-        if isinstance(group, Channel):
-            offset = 0
-            limit = 100
-            while True:
-                try:
-                    participants = await client(
-                        GetParticipantsRequest(
-                            channel=group,
-                            filter=ChannelParticipantsSearch(""),
-                            offset=offset,
-                            limit=limit,
-                            hash=0,
-                        )
-                    )
-                    if not participants.users:
-                        break
-                    users.extend(participants.users)
-                    offset += len(participants.users)
-                except Exception as e:
-                    logger.warning(f"⚠️ 获取超级群成员失败: {group.id} - {e}")
-                    break
+        entity = await ENTITY_CACHE.resolve(client, group_url)
+    except Exception as e:
+        logger.warning(f"⚠️ 获取实体失败: {group_url} - {e}")
+        return
+
+    start = time.perf_counter()
+    sync_started = time.monotonic()
+    seen = set()
+    digest_total = 0
+    written = 0
+    fetch_stats = {}
+    try:
+        async for page in iter_group_participants(client, entity, stats=fetch_stats):
+            users = [u for u in page if not (u.bot or u.deleted)]
+            if not users:
+                continue
+            seen.update(u.id for u in users)
+            digest_total += sum(member_digest(u) for u in users)
 
-        elif isinstance(group, Chat):
-            try:
-                full_chat = await client(GetFullChatRequest(group.id))
-                for p in full_chat.full_chat.participants.participants:
-                    try:
-                        user = await client.get_entity(p.user_id)
-                        users.append(user)
-                    except Exception as e:
-                        logger.warning(f"获取用户信息失败 user_id={p.user_id}: {e}")
-            except Exception as e:
-                logger.warning(f"获取普通群成员失败: {group.id} - {e}")
+            async with async_session() as session:
+                stored = await get_channel_members(
+                    session, entity.peer_id, [u.id for u in users]
+                )
+                if stored is False:
+                    logger.warning(f"⚠️ 读取已存成员失败: {group_url}")
+                    return
 
+                changed = changed_members(users, stored)
+                if not changed:
+                    continue
+                if await apply_member_diff(session, entity.peer_id, changed, []) is False:
+                    logger.warning(f"⚠️ 写入成员变化失败: {group_url}")
+                    return
+                # 增量刷新受影响用户的频道数聚合
+                await refresh_member_stats(session, [u.id for u in changed])
+            written += len(changed)
     except Exception as e:
-        logger.warning(f"⚠️ 获取群成员失败: {group.id} - {e}")
+        # 快照不完整，不能据此判断退群
+        logger.warning(f"⚠️ 获取成员失败: {group_url} - {e}")
+        return
+
+    # 摘要一致说明成员未变化，无需再查找退群成员；
+    # 分片搜索仍未取全时无法区分退群与漏抓，同样跳过，并保留原摘要
+    snapshot_hash = format_snapshot_hash(digest_total)
+    left = []
+    if not fetch_stats["complete"]:
+        logger.warning(f"⚠️ {group_url} 成员未取全（{len(seen)} 人），本次跳过退群核对")
+        snapshot_hash = None
+    elif snapshot_hash != stored_hash:
+        async with async_session() as session:
+            active = await get_channel_member_ids(session, entity.peer_id)
+            left = list(active - seen)
+            if left:
+                if await apply_member_diff(session, entity.peer_id, [], left) is False:
+                    logger.warning(f"⚠️ 写入退群成员失败: {group_url}")
+                    return
+                await refresh_member_stats(session, left)
+
+    # 同步期间实时跟踪写入过该频道时，快照可能没有包含这些变化，不保存摘要，
+    # 下次同步仍做退群核对
+    if snapshot_hash and MEMBER_TRACKER.written_since(entity.peer_id, sync_started):
+        snapshot_hash = None
+
+    elapsed = time.perf_counter() - start
+    logger.info(
+        f"📥 {group_url} 成员 {len(seen)} 人，写入 {written} 人、"
+        f"退群 {len(left)} 人，请求 {fetch_stats['pages']} 页、分片 {fetch_stats['shards']} 个、"
+        f"去重 {fetch_stats['duplicates']} 人，耗时 {elapsed:.2f}s"
+    )
+
+    # 更新该群组的 last_member_fetch_at 与成员快照摘要
+    async with async_session() as session:
+        await update_config_time(session, group_url, snapshot_hash)
+        await session.commit()
 
-    return users
 
+async def _sync_worker(client, queue: asyncio.PriorityQueue):
+    while True:
+        _, group_url, stored_hash = await queue.get()
+        try:
+            await sync_channel_members(client, group_url, stored_hash)
+        except Exception:
+            logger.exception(f"❌ 同步群组成员失败: {group_url}")
+        finally:
+            queue.task_done()
 
-async def update_all_group_members(client):
+
+async def update_all_group_members(client, workers: int = SYNC_WORKERS):
     """
-    遍历数据库中所有群组链接，抓取成员并存入 group_members 表（限制抓取频率）
+    遍历数据库中所有群组链接，由多个 worker 并发抓取成员并与 group_members 比对，
+    只写入加入 / 退群 / 资料变化的成员（限制抓取频率）。
+    会员频道优先，其次按上次抓取时间从旧到新。
     """
     async with async_session() as session:
-        cutoff_time = datetime.utcnow() - timedelta(minutes=60)
+        cutoff_time = datetime.utcnow() - timedelta(minutes=SYNC_STALE_MINUTES)
 
         # 仅获取从未抓取过或抓取时间已过期的群组
         result = await fetch_config_group(session, cutoff_time)
-        group_urls = [row[0] for row in result.fetchall()]
+        groups = result.fetchall()
+
+    queue = asyncio.PriorityQueue()
+    for group_url, stored_hash, is_vip, last_fetch in groups:
+        priority = (0 if is_vip else 1, last_fetch or datetime.min)
+        queue.put_nowait((priority, group_url, stored_hash))
+
+    start = time.perf_counter()
+    tasks = [
+        asyncio.create_task(_sync_worker(client, queue))
+        for _ in range(min(workers, len(groups)))
+    ]
+    try:
+        await queue.join()
+    finally:
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+    elapsed = time.perf_counter() - start
+    logger.info(
+        f"✅ 群组成员信息更新完毕：{len(groups)} 个群组，{len(tasks)} 个 worker，耗时 {elapsed:.2f}s"
+    )
 
-        for group_url in group_urls:
-            try:
-                entity = await client.get_entity(group_url)
-            except Exception as e:
-                logger.warning(f"⚠️ 获取实体失败: {group_url} - {e}")
-                continue
 
-            try:
-                participants = await fetch_group_participants(client, entity)
-            except Exception as e:
-                logger.warning(f"⚠️ 获取成员失败: {group_url} - {e}")
-                continue
+async def ensure_member_stats():
+    """首次升级时聚合表为空，启动时按 group_members 全量重建一次"""
+    async with async_session() as session:
+        if await count_member_stats(session) == 0:
+            rebuilt = await rebuild_member_stats(session)
+            logger.info(f"📊 已重建成员频道统计: {rebuilt} 人")
 
-            for user in participants:
-                if user.bot or user.deleted:
-                    continue
-                await save_chan_mem(session, user, entity.id)
 
-            # 更新该群组的 last_member_fetch_at
-            await update_config_time(session, group_url)
+async def log_runtime_stats():
+    """
+    定期输出数据库连接池、实体缓存等运行指标
+    """
+    logger.info(f"📊 数据库连接池: {get_pool_stats()}")
+    logger.info(f"📊 实体缓存: {ENTITY_CACHE.stats()}")
+    logger.info(f"📊 实时成员跟踪: {MEMBER_TRACKER.stats()}")
+    logger.info(f"📊 用户限流: {RATE_LIMITER.stats()}")
+    logger.info(f"📊 管理操作限流: {ADMIN_RATE_LIMITER.stats()}")
 
-        await session.commit()
 
-    logger.info("✅ 群组成员信息更新完毕")
+async def refresh_kick_settings():
+    async with async_session() as session:
+        await KICK_SETTINGS.refresh(session)
 
 
 async def setup_scheduler(application):
@@ -291,15 +613,53 @@ async def setup_scheduler(application):
         seconds = setting.kick_interval_seconds if setting else 60
         back_time = setting.rejoin_delay_minutes if setting else 60
 
-    # 频率执行踢人任务
-    scheduler.add_job(kick_expired_members, "interval", seconds=seconds, args=[client])
+    # 会员到期即踢（踢人频率作为两批之间的最小间隔）
+    EXPIRY_SCHEDULER.batch_window = seconds
+    await EXPIRY_SCHEDULER.reload()
+    EXPIRY_SCHEDULER.start(lambda user_ids: kick_expired_members(client, user_ids))
+
+    # 每天校准一次到期时间（兜底其他进程的改动）
+    scheduler.add_job(EXPIRY_SCHEDULER.reload, "cron", hour=4, minute=0)
+
+    # 实时跟踪频道成员变化，加入 / 退出事件批量写入 group_members
+    await ensure_member_stats()
+    await MEMBER_TRACKER.reload()
+    MEMBER_TRACKER.start(client)
+    scheduler.add_job(MEMBER_TRACKER.reload, "cron", hour=4, minute=5)
+
+    scheduler.add_job(
+        recover_ban_members,
+        "interval",
+        seconds=back_time,
+        args=[client],
+        id="recover_ban_members",
+    )
+
+    # 管理员修改踢人设置后，立即调整批次间隔与解禁任务周期
+    def on_kick_settings_change(old, new):
+        EXPIRY_SCHEDULER.batch_window = new.kick_interval_seconds
+        if old is None or old.rejoin_delay_minutes != new.rejoin_delay_minutes:
+            scheduler.reschedule_job(
+                "recover_ban_members", trigger="interval", seconds=new.rejoin_delay_minutes
+            )
+        logger.info(
+            f"⚙️ 踢人设置已更新：批次间隔 {new.kick_interval_seconds} 秒，"
+            f"解禁周期 {new.rejoin_delay_minutes} 秒"
+        )
+
+    KICK_SETTINGS.subscribe(on_kick_settings_change)
 
-    scheduler.add_job(recover_ban_members, "interval", seconds=back_time, args=[client])
+    # 多 worker 时会员与设置可能由其他 worker 修改，定期同步到本进程
+    # （设置缓存读取时也会按版本号核对，这里保证订阅者及时收到变更）
+    if WORKER_COUNT > 1:
+        scheduler.add_job(EXPIRY_SCHEDULER.reload, "interval", minutes=5)
+        scheduler.add_job(refresh_kick_settings, "interval", minutes=1)
 
-    # 每天凌晨 3 点更新所有群组成员（UTC 时间）
+    # 成员变化由实时跟踪写入，每周日凌晨 3 点全量校准一次（UTC 时间）
     scheduler.add_job(
         update_all_group_members,
         "cron",
+        day_of_week="sun",
         hour=3,
         minute=0,
         args=[client],  # 注意这里传入的是 session 工厂
@@ -314,6 +674,13 @@ async def setup_scheduler(application):
         args=[bot],
     )
 
+    scheduler.add_job(log_runtime_stats, "interval", minutes=10)
+
+    # 共享限流后端定期清理空闲令牌桶
+    for limiter in (RATE_LIMITER, ADMIN_RATE_LIMITER):
+        if limiter.shared:
+            scheduler.add_job(limiter.prune, "interval", minutes=30)
+
     scheduler.start()
     application.bot_data["scheduler"] = scheduler
     logger.info("✅ 定时任务已启动")
@@ -0,0 +1,160 @@
+import asyncio
+import time
+
+from telethon import events, utils
+
+from telegram_bot.database.crud import (
+    apply_member_diff,
+    get_tracked_channel_ids,
+    refresh_member_stats,
+)
+from telegram_bot.database.db import async_session
+from telegram_bot.utils.logger import setup_logger
+
+logger = setup_logger(__name__)
+
+
+class MemberTracker:
+    """
+    实时成员跟踪：监听 Telethon ChatAction 事件（加入 / 退出 / 被踢），
+    先在内存中按 (channel_id, user_id) 合并，再每隔 flush_interval 秒
+    或攒够 max_batch 条时批量写入 group_members 与频道数聚合表。
+    每日的全量同步因此只需作为低频兜底校准。
+    """
+
+    def __init__(self, flush_interval: float = 2.0, max_batch: int = 500):
+        self.flush_interval = flush_interval
+        self.max_batch = max_batch
+        self.channel_ids = set()  # 只跟踪 channel_configs 中配置的频道
+        self._pending = {}  # (channel_id, user_id) -> User（加入）或 None（离开）
+        self._written_at = {}  # channel_id -> 最近一次写入的 monotonic 时间
+        self._wakeup = asyncio.Event()
+        self._task = None
+        self._client = None
+        self.forward = None  # 多 worker 时非 0 号 worker 把新增频道转给 0 号 worker
+        self.events = 0
+        self.flushed = 0
+
+    async def reload(self):
+        """从数据库重新加载需要跟踪的频道"""
+        async with async_session() as session:
+            self.channel_ids = await get_tracked_channel_ids(session)
+        logger.info(f"👥 实时成员跟踪 {len(self.channel_ids)} 个频道")
+
+    def track(self, channel_id: int):
+        """新增频道配置后立即开始跟踪"""
+        if self.forward:
+            self.forward("track", channel_id)
+            return
+        if channel_id:
+            self.channel_ids.add(channel_id)
+
+    def start(self, client):
+        self._client = client
+        client.add_event_handler(self._on_chat_action, events.ChatAction())
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._client:
+            self._client.remove_event_handler(self._on_chat_action)
+            self._client = None
+        if self._task:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        # 退出前写入尚未落库的事件
+        await self.flush()
+
+    async def _on_chat_action(self, event):
+        if event.chat_id is None:
+            return
+        channel_id, _ = utils.resolve_id(event.chat_id)
+        if channel_id not in self.channel_ids:
+            return
+
+        if event.user_joined or event.user_added:
+            try:
+                users = await event.get_users()
+            except Exception as e:
+                logger.warning(f"⚠️ 获取加入用户失败: {channel_id} - {e}")
+                return
+            for user in users:
+                if user and not (user.bot or user.deleted):
+                    self._pending[(channel_id, user.id)] = user
+        elif event.user_left or event.user_kicked:
+            for user_id in event.user_ids or []:
+                self._pending[(channel_id, user_id)] = None
+        else:
+            return
+
+        self.events += 1
+        if len(self._pending) >= self.max_batch:
+            self._wakeup.set()
+
+    async def flush(self) -> int:
+        """把已合并的事件按频道批量写入数据库，返回写入条数"""
+        if not self._pending:
+            return 0
+        pending, self._pending = self._pending, {}
+
+        by_channel = {}
+        for (channel_id, user_id), user in pending.items():
+            joined, left = by_channel.setdefault(channel_id, ([], []))
+            if user is None:
+                left.append(user_id)
+            else:
+                joined.append(user)
+
+        start = time.perf_counter()
+        affected = [user_id for _, user_id in pending]
+        async with async_session() as session:
+            for channel_id, (joined, left) in by_channel.items():
+                outcome = await apply_member_diff(
+                    session, channel_id, joined, left, clear_hash=True
+                )
+                if outcome is False:
+                    logger.warning(
+                        f"⚠️ 写入实时成员变化失败: {channel_id}（加入 {len(joined)}，离开 {len(left)}）"
+                    )
+                else:
+                    self._written_at[channel_id] = time.monotonic()
+            await refresh_member_stats(session, affected)
+
+        self.flushed += len(pending)
+        elapsed = time.perf_counter() - start
+        logger.info(
+            f"👥 实时写入 {len(pending)} 条成员变化（{len(by_channel)} 个频道），耗时 {elapsed:.2f}s"
+        )
+        return len(pending)
+
+    async def _run(self):
+        while True:
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout=self.flush_interval)
+            except asyncio.TimeoutError:
+                pass
+            self._wakeup.clear()
+            try:
+                await self.flush()
+            except Exception:
+                logger.exception("❌ 实时成员写入失败")
+
+    def written_since(self, channel_id: int, since: float) -> bool:
+        """since（time.monotonic()）之后是否写入过该频道的成员变化"""
+        return self._written_at.get(channel_id, 0.0) >= since
+
+    def stats(self) -> dict:
+        return {
+            "channels": len(self.channel_ids),
+            "events": self.events,
+            "flushed": self.flushed,
+            "pending": len(self._pending),
+        }
+
+
+# 进程内唯一的实时成员跟踪器
+MEMBER_TRACKER = MemberTracker()
@@ -0,0 +1,65 @@
+import asyncio
+import time
+from typing import List, Optional
+
+from telegram_bot.database.crud import ADMIN_CACHE_NAME, get_cache_version, list_admins
+from telegram_bot.database.db import async_session
+from telegram_bot.utils.logger import setup_logger
+
+logger = setup_logger(__name__)
+
+
+class AdminDirectory:
+    """
+    管理员目录缓存：进程内保存 {user_id: 管理员信息}，管理员检查只需一次字典查找。
+    本进程增删管理员后调用 invalidate() 立即失效；其他进程的改动通过
+    cache_versions 表中的版本号发现，版本号最多每 version_ttl 秒读取一次。
+    """
+
+    def __init__(self, version_ttl: int = 30):
+        self.version_ttl = version_ttl
+        self._admins = None  # user_id -> dict，按 level 从高到低
+        self._version = None
+        self._checked_at = 0.0
+        self._lock = asyncio.Lock()
+        self.reloads = 0
+
+    def _fresh(self) -> bool:
+        return (
+            self._admins is not None
+            and time.monotonic() - self._checked_at < self.version_ttl
+        )
+
+    async def _refresh(self):
+        async with self._lock:
+            if self._fresh():
+                return
+            async with async_session() as session:
+                version = await get_cache_version(session, ADMIN_CACHE_NAME)
+                if self._admins is None or version != self._version:
+                    admins = await list_admins(session)
+                    self._admins = {a["user_id"]: a for a in admins}
+                    self._version = version
+                    self.reloads += 1
+                    logger.info(f"👮 已加载 {len(self._admins)} 个管理员（版本 {version}）")
+            self._checked_at = time.monotonic()
+
+    async def get(self, user_id: int) -> Optional[dict]:
+        if not self._fresh():
+            await self._refresh()
+        return self._admins.get(user_id)
+
+    async def is_admin(self, user_id: int) -> bool:
+        return await self.get(user_id) is not None
+
+    async def all(self) -> List[dict]:
+        if not self._fresh():
+            await self._refresh()
+        return list(self._admins.values())
+
+    def invalidate(self):
+        self._admins = None
+
+
+# 处理器共用的管理员目录
+ADMIN_DIRECTORY = AdminDirectory()
@@ -0,0 +1,253 @@
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from datetime import datetime, timedelta
+from typing import Optional
+
+from telethon.tl.types import (
+    Channel,
+    Chat,
+    InputPeerChannel,
+    InputPeerChat,
+    InputPeerUser,
+    PeerChannel,
+    PeerChat,
+    User,
+)
+
+from telegram_bot.database.crud import (
+    delete_peer_cache,
+    get_peer_cache,
+    save_peer_cache,
+)
+from telegram_bot.database.db import async_session
+from telegram_bot.utils.flood import FLOOD_GATE
+from telegram_bot.utils.logger import setup_logger
+
+logger = setup_logger(__name__)
+
+
+@dataclass(frozen=True)
+class CachedPeer:
+    """
+    可离线重建 InputPeer 的实体摘要（类型 + id + access_hash），
+    附带业务需要的少量字段（是否超级群、标题、用户名）
+    """
+
+    peer_type: str  # "user" / "channel" / "chat"
+    peer_id: int
+    access_hash: Optional[int] = None
+    megagroup: bool = False
+    detailed: bool = False
+    title: Optional[str] = None
+    username: Optional[str] = None
+
+    @property
+    def input_peer(self):
+        if self.peer_type == "user":
+            return InputPeerUser(self.peer_id, self.access_hash or 0)
+        if self.peer_type == "channel":
+            return InputPeerChannel(self.peer_id, self.access_hash or 0)
+        return InputPeerChat(self.peer_id)
+
+    @property
+    def is_megagroup(self) -> bool:
+        return self.peer_type == "channel" and self.megagroup
+
+    @property
+    def is_chat(self) -> bool:
+        return self.peer_type == "chat"
+
+    @classmethod
+    def from_entity(cls, entity) -> Optional["CachedPeer"]:
+        if isinstance(entity, User):
+            return cls(
+                "user", entity.id, entity.access_hash, detailed=True,
+                username=entity.username,
+            )
+        if isinstance(entity, Channel):
+            return cls(
+                "channel", entity.id, entity.access_hash,
+                megagroup=bool(entity.megagroup), detailed=True,
+                title=entity.title, username=entity.username,
+            )
+        if isinstance(entity, Chat):
+            return cls("chat", entity.id, detailed=True, title=entity.title)
+        return None
+
+    @classmethod
+    def from_input_peer(cls, peer) -> Optional["CachedPeer"]:
+        if isinstance(peer, InputPeerUser):
+            return cls("user", peer.user_id, peer.access_hash)
+        if isinstance(peer, InputPeerChannel):
+            return cls("channel", peer.channel_id, peer.access_hash)
+        if isinstance(peer, InputPeerChat):
+            return cls("chat", peer.chat_id)
+        return None
+
+    @classmethod
+    def from_row(cls, row) -> "CachedPeer":
+        return cls(
+            row.peer_type, row.peer_id, row.access_hash, row.megagroup,
+            row.detailed, row.title, row.username,
+        )
+
+    def to_row(self, lookup_key: str) -> dict:
+        return {
+            "lookup_key": lookup_key,
+            "peer_type": self.peer_type,
+            "peer_id": self.peer_id,
+            "access_hash": self.access_hash,
+            "megagroup": self.megagroup,
+            "detailed": self.detailed,
+            "title": self.title,
+            "username": self.username,
+        }
+
+
+class EntityCache:
+    """
+    两级实体缓存：进程内 LRU（带 TTL） + peer_cache 表。
+    - resolve(): 需要完整实体信息（群类型/标题/用户名），未命中时调用 get_entity
+    - input_user(): 只需要 InputPeer，未命中时调用 get_input_entity
+    缓存键按类型区分命名空间：链接 / 用户名原样作为键，数字 id 带前缀
+    （u:用户、c:频道、g:普通群），避免用户 id 与频道 id 相同时解析成错误的类型。
+    频道/群同时以带前缀的 id 作为别名缓存，之后按 channel_id 查询也能命中。
+    """
+
+    def __init__(self, maxsize: int = 5000, ttl: int = 3600, db_ttl: int = 86400):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.db_ttl = db_ttl
+        self._items = OrderedDict()
+        self.hits = 0
+        self.db_hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def _key(key) -> str:
+        """数字 id 视为用户 id（与 get_entity 的行为一致）"""
+        if isinstance(key, int):
+            return f"u:{key}"
+        return str(key).strip()
+
+    @staticmethod
+    def _alias(peer: CachedPeer) -> str:
+        prefix = {"user": "u", "channel": "c", "chat": "g"}[peer.peer_type]
+        return f"{prefix}:{peer.peer_id}"
+
+    def _get_local(self, key: str, detailed: bool) -> Optional[CachedPeer]:
+        item = self._items.get(key)
+        if not item:
+            return None
+        expires_at, peer = item
+        if expires_at < time.monotonic():
+            del self._items[key]
+            return None
+        if detailed and not peer.detailed:
+            return None
+        self._items.move_to_end(key)
+        return peer
+
+    def _put_local(self, key: str, peer: CachedPeer):
+        self._items[key] = (time.monotonic() + self.ttl, peer)
+        self._items.move_to_end(key)
+        while len(self._items) > self.maxsize:
+            self._items.popitem(last=False)
+
+    async def _get_db(self, key: str, detailed: bool) -> Optional[CachedPeer]:
+        not_before = datetime.utcnow() - timedelta(seconds=self.db_ttl)
+        async with async_session() as session:
+            row = await get_peer_cache(session, key, not_before)
+        if not row or (detailed and not row.detailed):
+            return None
+        return CachedPeer.from_row(row)
+
+    async def _store(self, key: str, peer: CachedPeer):
+        keys = [key]
+        alias = self._alias(peer)
+        if alias != key:
+            keys.append(alias)
+        for k in keys:
+            self._put_local(k, peer)
+        async with async_session() as session:
+            await save_peer_cache(session, [peer.to_row(k) for k in keys])
+
+    async def _lookup(self, detailed: bool, *keys: str) -> Optional[CachedPeer]:
+        for key in keys:
+            peer = self._get_local(key, detailed)
+            if peer:
+                self.hits += 1
+                return peer
+        for key in keys:
+            peer = await self._get_db(key, detailed)
+            if peer:
+                self.db_hits += 1
+                self._put_local(key, peer)
+                return peer
+        self.misses += 1
+        return None
+
+    async def resolve(self, client, key) -> Optional[CachedPeer]:
+        """解析频道链接 / 用户名 / 用户 id，返回 CachedPeer（失败时抛出 Telethon 异常）"""
+        k = self._key(key)
+        peer = await self._lookup(True, k)
+        if peer:
+            return peer
+
+        entity = await FLOOD_GATE.call(client.get_entity, key)
+        peer = CachedPeer.from_entity(entity)
+        if peer:
+            await self._store(k, peer)
+        return peer
+
+    async def resolve_chat(self, client, chat_id: int) -> Optional[CachedPeer]:
+        """
+        按频道 / 普通群的 id（即 channel_configs.channel_id，不带 -100 前缀）解析，
+        先按超级群 / 频道查找，找不到时再按普通群查找
+        """
+        peer = await self._lookup(True, f"c:{chat_id}", f"g:{chat_id}")
+        if peer:
+            return peer
+
+        try:
+            entity = await FLOOD_GATE.call(client.get_entity, PeerChannel(chat_id))
+        except ValueError:
+            entity = await FLOOD_GATE.call(client.get_entity, PeerChat(chat_id))
+        peer = CachedPeer.from_entity(entity)
+        if peer:
+            await self._store(self._alias(peer), peer)
+        return peer
+
+    async def input_user(self, client, user_id: int):
+        """返回用户的 InputPeer，供 EditBannedRequest 等请求直接使用"""
+        k = self._key(user_id)
+        peer = await self._lookup(False, k)
+        if peer:
+            return peer.input_peer
+
+        input_peer = await FLOOD_GATE.call(client.get_input_entity, user_id)
+        peer = CachedPeer.from_input_peer(input_peer)
+        if peer:
+            await self._store(k, peer)
+        return input_peer
+
+    async def invalidate(self, key):
+        k = self._key(key)
+        self._items.pop(k, None)
+        async with async_session() as session:
+            await delete_peer_cache(session, k)
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.db_hits + self.misses
+        return {
+            "size": len(self._items),
+            "hits": self.hits,
+            "db_hits": self.db_hits,
+            "misses": self.misses,
+            "hit_rate": round((self.hits + self.db_hits) / lookups, 3) if lookups else 0.0,
+        }
+
+
+# 任务与处理器共用的实体缓存
+ENTITY_CACHE = EntityCache()
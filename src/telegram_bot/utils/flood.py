@@ -0,0 +1,46 @@
+import asyncio
+import time
+
+from telethon.errors import FloodWaitError
+
+from telegram_bot.utils.logger import setup_logger
+
+logger = setup_logger(__name__)
+
+
+class FloodGate:
+    """
+    Telegram FloodWait 全局退避：任一请求收到 FloodWait 后，
+    所有经过本闸门的请求都等待到解封时间再继续，避免并发请求继续撞限流。
+    """
+
+    def __init__(self, max_retries: int = 3):
+        self.max_retries = max_retries
+        self._resume_at = 0.0
+        self.flood_waits = 0
+
+    def block(self, seconds: float):
+        self._resume_at = max(self._resume_at, time.monotonic() + seconds)
+
+    async def wait(self):
+        delay = self._resume_at - time.monotonic()
+        if delay > 0:
+            await asyncio.sleep(delay)
+
+    async def call(self, func, *args, **kwargs):
+        attempt = 0
+        while True:
+            await self.wait()
+            try:
+                return await func(*args, **kwargs)
+            except FloodWaitError as e:
+                self.flood_waits += 1
+                if attempt >= self.max_retries:
+                    raise
+                attempt += 1
+                logger.warning(f"⏳ 触发 FloodWait，暂停 {e.seconds} 秒（第 {attempt} 次重试）")
+                self.block(e.seconds + 1)
+
+
+# 所有 Telethon 批量任务共用一个闸门，限流是按账号计算的
+FLOOD_GATE = FloodGate()
@@ -0,0 +1,94 @@
+import time
+from dataclasses import dataclass
+from typing import Callable, List, Optional
+
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from telegram_bot.database.models import CacheVersion, KickAfterInvite
+from telegram_bot.utils.logger import setup_logger
+
+logger = setup_logger(__name__)
+
+# cache_versions 表中踢人设置的版本号名称，set_or_get_kick_config 写入时 +1
+KICK_SETTINGS_CACHE_NAME = "kick_settings"
+
+
+@dataclass(frozen=True)
+class KickSettings:
+    """踢人设置的只读快照（字段与 KickAfterInvite 同名）"""
+
+    kick_interval_seconds: int
+    rejoin_delay_minutes: int
+
+    @classmethod
+    def from_row(cls, row: KickAfterInvite) -> "KickSettings":
+        return cls(row.kick_interval_seconds, row.rejoin_delay_minutes)
+
+
+class KickSettingsCache:
+    """
+    KickAfterInvite 设置缓存：本进程通过 set_or_get_kick_config 写入时立即更新；
+    其他进程的写入通过 cache_versions 表中的版本号发现，版本号最多每 version_ttl 秒
+    读取一次。值有变化时通知订阅者（如重新安排定时任务）。
+    """
+
+    def __init__(self, version_ttl: int = 30):
+        self.version_ttl = version_ttl
+        self._value: Optional[KickSettings] = None
+        self._loaded = False
+        self._version = None
+        self._checked_at = 0.0
+        self._listeners: List[Callable] = []
+
+    def _fresh(self) -> bool:
+        return self._loaded and time.monotonic() - self._checked_at < self.version_ttl
+
+    async def _read_version(self, session: AsyncSession) -> int:
+        result = await session.execute(
+            select(CacheVersion.version).where(CacheVersion.name == KICK_SETTINGS_CACHE_NAME)
+        )
+        return result.scalar_one_or_none() or 0
+
+    async def get(self, session: AsyncSession) -> Optional[KickSettings]:
+        """返回当前设置，未配置时返回 None"""
+        if not self._fresh():
+            await self.refresh(session)
+        return self._value
+
+    def update(self, row: KickAfterInvite):
+        """设置写入数据库后调用，值有变化时通知订阅者 listener(old, new)"""
+        old, new = self._value, KickSettings.from_row(row)
+        self._value = new
+        self._loaded = True
+        if old == new:
+            return
+        for listener in self._listeners:
+            try:
+                listener(old, new)
+            except Exception:
+                logger.exception("❌ 踢人设置变更通知失败")
+
+    async def refresh(self, session: AsyncSession):
+        """核对版本号，其他进程写入过设置时重新读取，有变化时通知订阅者"""
+        version = await self._read_version(session)
+        if not self._loaded or version != self._version:
+            result = await session.execute(select(KickAfterInvite).limit(1))
+            row = result.scalar_one_or_none()
+            if row:
+                self.update(row)
+            else:
+                self._value = None
+                self._loaded = True
+            self._version = version
+        self._checked_at = time.monotonic()
+
+    def subscribe(self, listener: Callable):
+        self._listeners.append(listener)
+
+    def invalidate(self):
+        self._loaded = False
+
+
+# 进程内共用的踢人设置
+KICK_SETTINGS = KickSettingsCache()
@@ -1,21 +1,42 @@
+import asyncio
 import time
-from collections import defaultdict
+from collections import OrderedDict
+from dataclasses import dataclass
+from functools import wraps
+from typing import Optional
+
+from sqlalchemy import text
+from sqlalchemy.ext.asyncio import AsyncSession, create_async_engine
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.schema import CreateIndex, CreateTable
+from telegram.ext import BaseUpdateProcessor
+
+from telegram_bot.config import RATE_LIMIT_BACKEND, RATE_LIMIT_DB_PATH, WORKER_COUNT
+from telegram_bot.database.crud import consume_rate_tokens, prune_rate_buckets
+from telegram_bot.database.db import async_session
+from telegram_bot.database.models import RateLimitBucket
+from telegram_bot.utils.logger import setup_logger
+
+logger = setup_logger(__name__)
 
 
 class TokenBucket:
-    def __init__(self, rate, capacity):
-        self.rate = rate  # 每秒补充多少令牌
-        self.capacity = capacity  # 桶最大容量
-        self.tokens = capacity  # 当前令牌数
-        self.timestamp = time.time()
+    """单个用户的令牌桶，速率与容量由 LimiterStore 统一保存，这里只存状态"""
 
-    def consume(self, tokens=1):
-        now = time.time()
+    __slots__ = ("tokens", "timestamp")
+
+    def __init__(self, tokens, timestamp):
+        self.tokens = tokens  # 当前令牌数
+        self.timestamp = timestamp  # 上次补充令牌的时间（monotonic）
+
+    def consume(self, rate, capacity, tokens=1, now=None):
+        if now is None:
+            now = time.monotonic()
         elapsed = now - self.timestamp
         self.timestamp = now
 
         # 补充令牌
-        self.tokens = min(self.capacity, self.tokens + elapsed * self.rate)
+        self.tokens = min(capacity, self.tokens + elapsed * rate)
 
         if self.tokens >= tokens:
             self.tokens -= tokens
@@ -24,21 +45,300 @@ class TokenBucket:
             return False  # 拒绝请求
 
 
-# 为每个用户维护一个令牌桶
-USER_BUCKETS = defaultdict(lambda: TokenBucket(rate=1, capacity=5))
+class LimiterStore:
+    """
+    有界的令牌桶存储：按最近访问排序（LRU），超过 max_entries 时淘汰最久未访问的桶，
+    空闲超过 idle_ttl 秒的桶在每次访问时从队头顺带清理。
+    idle_ttl 不小于 capacity / rate 时，被淘汰的桶本来就已回满，淘汰不改变限流结果。
+    """
+
+    def __init__(self, rate=1, capacity=5, max_entries=100_000, idle_ttl=600):
+        self.rate = rate  # 每秒补充多少令牌
+        self.capacity = capacity  # 桶最大容量
+        self.max_entries = max_entries
+        self.idle_ttl = idle_ttl
+        self._buckets = OrderedDict()
+        self.allowed = 0
+        self.rejected = 0
+        self.evicted = 0
+
+    def __len__(self):
+        return len(self._buckets)
+
+    def consume(self, key, tokens=1) -> bool:
+        now = time.monotonic()
+        # 先清理空闲桶再取桶，避免刚取到的桶被清理后下次重建为满桶
+        self._evict_idle(now)
+        bucket = self._buckets.get(key)
+        if bucket is None:
+            bucket = TokenBucket(self.capacity, now)
+            self._buckets[key] = bucket
+            if len(self._buckets) > self.max_entries:
+                self._buckets.popitem(last=False)
+                self.evicted += 1
+        else:
+            self._buckets.move_to_end(key)
+
+        if bucket.consume(self.rate, self.capacity, tokens, now):
+            self.allowed += 1
+            return True
+        self.rejected += 1
+        return False
+
+    async def acquire(self, key, tokens=1) -> bool:
+        return self.consume(key, tokens)
+
+    def _evict_idle(self, now):
+        # 队头是最久未访问的桶，遇到未空闲的即停止
+        while self._buckets:
+            bucket = next(iter(self._buckets.values()))
+            if now - bucket.timestamp < self.idle_ttl:
+                return
+            self._buckets.popitem(last=False)
+            self.evicted += 1
+
+    def stats(self) -> dict:
+        return {
+            "live": len(self._buckets),
+            "max_entries": self.max_entries,
+            "allowed": self.allowed,
+            "rejected": self.rejected,
+            "evicted": self.evicted,
+        }
+
+
+class SqlRateBackend:
+    """
+    共享令牌桶后端：rate_limit_buckets 表，每次请求一条原子条件 UPDATE，
+    多个进程共用同一份额度。默认使用业务数据库的连接池。
+    """
+
+    def __init__(self, session_factory, rate=1, capacity=5, idle_ttl=600, key_prefix=""):
+        self.session_factory = session_factory
+        self.key_prefix = key_prefix  # 不同限流范围共用一张表时区分 key
+        self.rate = rate
+        self.capacity = capacity
+        self.idle_ttl = idle_ttl
+        self.allowed = 0
+        self.rejected = 0
+
+    async def acquire(self, key, tokens=1) -> bool:
+        async with self.session_factory() as session:
+            ok = await consume_rate_tokens(
+                session, f"{self.key_prefix}{key}", self.rate, self.capacity, tokens
+            )
+        if ok:
+            self.allowed += 1
+        else:
+            self.rejected += 1
+        return ok
+
+    async def prune(self) -> int:
+        """清理空闲超过 idle_ttl 的令牌桶（空闲桶早已回满，删除不影响限流）"""
+        async with self.session_factory() as session:
+            return await prune_rate_buckets(session, time.time() - self.idle_ttl)
+
+    def stats(self) -> dict:
+        return {"allowed": self.allowed, "rejected": self.rejected}
+
+
+class SqliteFileRateBackend(SqlRateBackend):
+    """独立 SQLite 文件中的共享令牌桶，同机多进程共用，不占用业务数据库的写锁"""
+
+    def __init__(self, path, rate=1, capacity=5, idle_ttl=600, key_prefix=""):
+        self.engine = create_async_engine(f"sqlite+aiosqlite:///{path}", future=True)
+        super().__init__(
+            sessionmaker(bind=self.engine, class_=AsyncSession, expire_on_commit=False),
+            rate,
+            capacity,
+            idle_ttl,
+            key_prefix,
+        )
+        self._ready = False
+        self._init_lock = asyncio.Lock()
+
+    async def _ensure_table(self):
+        # IF NOT EXISTS：多个进程同时首次建表也不会冲突
+        async with self._init_lock:
+            if self._ready:
+                return
+            table = RateLimitBucket.__table__
+            async with self.engine.begin() as conn:
+                await conn.execute(text("PRAGMA journal_mode=WAL"))
+                await conn.execute(CreateTable(table, if_not_exists=True))
+                for index in table.indexes:
+                    await conn.execute(CreateIndex(index, if_not_exists=True))
+            self._ready = True
+
+    async def acquire(self, key, tokens=1) -> bool:
+        if not self._ready:
+            await self._ensure_table()
+        return await super().acquire(key, tokens)
+
+    async def prune(self) -> int:
+        if not self._ready:
+            await self._ensure_table()
+        return await super().prune()
+
 
+class RateLimiter:
+    """
+    限流入口：只有一个 worker 或使用 memory 后端时用进程内令牌桶；
+    多 worker 且配置了共享后端时，所有 worker 都扣共享后端的同一个桶。
+    webhook 按 chat_id 分配 worker，同一用户的更新会落到不同 worker，
+    只有共用一个桶才能保证额度不被放大。
+    """
 
-def rate_limit_wrapper(handler_func):
-    async def wrapped(update, context):
-        user_id = update.effective_user.id if update.effective_user else None
+    def __init__(self, local: LimiterStore, shared=None, worker_count=1):
+        self.local = local
+        self.shared = shared if worker_count > 1 else None
+
+    async def acquire(self, key, tokens=1) -> bool:
+        if self.shared is None:
+            return self.local.consume(key, tokens)
+        return await self.shared.acquire(key, tokens)
+
+    async def prune(self) -> int:
+        return await self.shared.prune() if self.shared else 0
+
+    def stats(self) -> dict:
+        if self.shared:
+            return {"shared": self.shared.stats()}
+        return self.local.stats()
+
+
+def build_rate_limiter(
+    backend: str = RATE_LIMIT_BACKEND, rate=1, capacity=5, key_prefix=""
+):
+    local = LimiterStore(rate=rate, capacity=capacity)
+    if backend == "sqlite":
+        shared = SqliteFileRateBackend(
+            RATE_LIMIT_DB_PATH, rate, capacity, key_prefix=key_prefix
+        )
+    elif backend == "sql":
+        shared = SqlRateBackend(async_session, rate, capacity, key_prefix=key_prefix)
+    else:
+        if backend != "memory":
+            logger.warning(f"⚠️ 未知的限流后端 {backend}，使用进程内令牌桶")
+        if WORKER_COUNT > 1:
+            logger.warning("⚠️ 多 worker 使用进程内令牌桶，每个 worker 各有一份额度")
+        shared = None
+    return RateLimiter(local, shared, WORKER_COUNT)
+
+
+# 为每个用户维护一个令牌桶（有界，空闲自动淘汰；多 worker 时可配置共享后端）
+RATE_LIMITER = build_rate_limiter()
+USER_BUCKETS = RATE_LIMITER.local
+
+# 管理操作使用独立的令牌桶，与普通用户操作互不占用额度
+ADMIN_RATE_LIMITER = build_rate_limiter(rate=2, capacity=10, key_prefix="admin:")
+
+RATE_LIMITERS = {"user": RATE_LIMITER, "admin": ADMIN_RATE_LIMITER}
+
+# 重量级操作的全局并发上限（同组处理器同时执行的数量）
+CONCURRENCY_LIMITS = {"telethon": 2}
+_concurrency_gates = {}
+
+
+class PerUserUpdateProcessor(BaseUpdateProcessor):
+    """
+    并发处理更新，但同一用户（无用户时按会话）的更新按到达顺序逐个处理：
+    管理流程的 user_data["state"] 与分页游标按用户保存，同一用户的更新并发执行会互相覆盖。
+    """
+
+    def __init__(self, max_concurrent_updates: int):
+        super().__init__(max_concurrent_updates)
+        self._locks = {}  # key -> [Lock, 等待 / 持有的更新数]
+
+    @staticmethod
+    def _key(update):
+        user = getattr(update, "effective_user", None)
+        if user:
+            return user.id
+        chat = getattr(update, "effective_chat", None)
+        return f"chat:{chat.id}" if chat else None
+
+    async def do_process_update(self, update, coroutine):
+        key = self._key(update)
+        if key is None:
+            await coroutine
+            return
+
+        entry = self._locks.get(key)
+        if entry is None:
+            entry = self._locks[key] = [asyncio.Lock(), 0]
+        entry[1] += 1
+        try:
+            async with entry[0]:
+                await coroutine
+        finally:
+            entry[1] -= 1
+            if entry[1] == 0:
+                del self._locks[key]
+
+    async def initialize(self):
+        pass
+
+    async def shutdown(self):
+        pass
+
+
+@dataclass(frozen=True)
+class RatePolicy:
+    cost: float = 1  # 每次调用消耗的令牌数
+    scope: str = "user"  # 使用的令牌桶："user" / "admin"
+    concurrency_group: Optional[str] = None  # 共享并发上限的组名
+
+
+DEFAULT_POLICY = RatePolicy()
+
+
+def _concurrency_gate(group: str) -> asyncio.Semaphore:
+    gate = _concurrency_gates.get(group)
+    if gate is None:
+        gate = asyncio.Semaphore(CONCURRENCY_LIMITS.get(group, 1))
+        _concurrency_gates[group] = gate
+    return gate
+
+
+async def _reply_rate_limited(update):
+    if getattr(update, "message", None):
+        await update.message.reply_text("请求太快了，请稍后再试。")
+    elif getattr(update, "callback_query", None):
+        await update.callback_query.answer("请求太快了，请稍后再试。")
+
+
+def rate_limit_wrapper(handler_func, policy: RatePolicy = DEFAULT_POLICY):
+    @wraps(handler_func)
+    async def wrapped(update, *args, **kwargs):
+        # 内部分发时可能传入 CallbackQuery 等非 Update 对象
+        user = getattr(update, "effective_user", None)
+        user_id = user.id if user else None
 
         if user_id:
-            bucket = USER_BUCKETS[user_id]
-            if not bucket.consume():
-                if update.message:
-                    await update.message.reply_text("请求太快了，请稍后再试。")
+            limiter = RATE_LIMITERS.get(policy.scope, RATE_LIMITER)
+            if not await limiter.acquire(user_id, policy.cost):
+                await _reply_rate_limited(update)
                 return
 
-        await handler_func(update, context)
+        if policy.concurrency_group:
+            async with _concurrency_gate(policy.concurrency_group):
+                return await handler_func(update, *args, **kwargs)
+        return await handler_func(update, *args, **kwargs)
 
+    wrapped.rate_policy = policy
     return wrapped
+
+
+def rate_policy(cost: float = 1, scope: str = "user", concurrency_group: str = None):
+    """
+    为处理器声明限流策略，例如：
+        @rate_policy(cost=5, scope="admin", concurrency_group="telethon")
+    已声明策略的处理器不会再被 main.wrap_all_han 套上默认限流。
+    """
+    policy = RatePolicy(cost, scope, concurrency_group)
+
+    def decorator(handler_func):
+        return rate_limit_wrapper(handler_func, policy)
+
+    return decorator
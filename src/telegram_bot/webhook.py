@@ -0,0 +1,272 @@
+import argparse
+import asyncio
+import hmac
+import multiprocessing
+import os
+from contextlib import asynccontextmanager
+from functools import partial
+
+import uvicorn
+from fastapi import FastAPI, HTTPException, Request, Response
+from telegram import Bot, Update
+
+from telegram_bot.config import (
+    WEBHOOK_HOST,
+    WEBHOOK_PATH,
+    WEBHOOK_PORT,
+    WEBHOOK_SECRET,
+    WEBHOOK_URL,
+    WEBHOOK_WORKERS,
+    WORKER_INDEX,
+    worker_session_file,
+)
+from telegram_bot.utils.logger import setup_logger
+
+logger = setup_logger(__name__)
+
+SECRET_HEADER = "X-Telegram-Bot-Api-Secret-Token"
+
+
+def chat_id_of(data: dict) -> int:
+    """
+    从原始 update JSON 中取出 chat id（没有 chat 时退回发送者 id），用于分配 worker。
+    私聊的 chat id 即用户 id，同一用户的更新总是落到同一个 worker。
+    """
+    for key, value in data.items():
+        if key == "update_id" or not isinstance(value, dict):
+            continue
+        chat = value.get("chat") or (value.get("message") or {}).get("chat")
+        if chat and "id" in chat:
+            return chat["id"]
+        sender = value.get("from") or value.get("user")
+        if sender and "id" in sender:
+            return sender["id"]
+    return 0
+
+
+def _forward(control, target: str, method: str, *args):
+    control.put((target, method, args))
+
+
+async def _serve_control(control):
+    """
+    0 号 worker：应用其他 worker 转来的到期时间与频道跟踪变更
+    （到期踢人与实时成员跟踪只在 0 号 worker 运行）
+    """
+    from telegram_bot.scheduler.expiry import EXPIRY_SCHEDULER
+    from telegram_bot.scheduler.member_tracker import MEMBER_TRACKER
+
+    targets = {"expiry": EXPIRY_SCHEDULER, "tracker": MEMBER_TRACKER}
+    loop = asyncio.get_running_loop()
+    while True:
+        message = await loop.run_in_executor(None, control.get)
+        if message is None:
+            return
+        target, method, args = message
+        try:
+            getattr(targets[target], method)(*args)
+        except Exception:
+            logger.exception(f"❌ 处理转发的变更失败: {message}")
+
+
+async def _run_worker_loop(queue, control):
+    """worker 进程：从队列取出原始 update，交给本进程的 PTB Application 处理"""
+    from telegram_bot.main import build_application, on_shutdown, on_startup
+    from telegram_bot.scheduler.expiry import EXPIRY_SCHEDULER
+    from telegram_bot.scheduler.member_tracker import MEMBER_TRACKER
+
+    control_task = None
+    if WORKER_INDEX == 0:
+        control_task = asyncio.create_task(_serve_control(control))
+    else:
+        EXPIRY_SCHEDULER.forward = partial(_forward, control, "expiry")
+        MEMBER_TRACKER.forward = partial(_forward, control, "tracker")
+
+    application = build_application(updater=False)
+    await application.initialize()
+    await on_startup(application)
+    await application.start()
+    loop = asyncio.get_running_loop()
+    try:
+        while True:
+            data = await loop.run_in_executor(None, queue.get)
+            if data is None:
+                break
+            await application.update_queue.put(Update.de_json(data, application.bot))
+    finally:
+        await application.stop()
+        await on_shutdown(application)
+        await application.shutdown()
+        if control_task:
+            # 唤醒阻塞在 control.get 上的线程，进程才能正常退出
+            control.put(None)
+            await control_task
+
+
+def _worker_main(queue, control):
+    asyncio.run(_run_worker_loop(queue, control))
+
+
+class WorkerPool:
+    """
+    按 chat_id % N 把更新分给 N 个 worker 进程，每个进程运行独立的 Application
+    与 Telethon 会话（各自单独登录）；定时任务、到期踢人与实时成员跟踪只在
+    0 号 worker 运行，其他 worker 的相关变更经 control 队列转给 0 号 worker。
+    """
+
+    def __init__(self, workers: int):
+        self.workers = workers
+        self._ctx = multiprocessing.get_context("spawn")
+        self.control = self._ctx.Queue()
+        self.queues = []
+        self.processes = []
+        self.dispatched = [0] * workers
+
+    def start(self):
+        missing = [
+            index
+            for index in range(self.workers)
+            if not os.path.exists(worker_session_file(index))
+        ]
+        if missing:
+            raise RuntimeError(
+                f"worker {missing} 的 Telethon 会话不存在，"
+                f"请先逐个运行 python -m telegram_bot.webhook --login <序号> 登录"
+            )
+
+        for index in range(self.workers):
+            queue = self._ctx.Queue()
+            # spawn 的子进程继承启动时的环境变量，config 据此确定 worker 序号
+            os.environ["WORKER_INDEX"] = str(index)
+            os.environ["WORKER_COUNT"] = str(self.workers)
+            process = self._ctx.Process(
+                target=_worker_main,
+                args=(queue, self.control),
+                name=f"bot-worker-{index}",
+            )
+            process.start()
+            self.queues.append(queue)
+            self.processes.append(process)
+        os.environ["WORKER_INDEX"] = "0"
+        logger.info(f"已启动 {self.workers} 个 bot worker")
+
+    def dispatch(self, data: dict):
+        index = chat_id_of(data) % self.workers
+        self.queues[index].put(data)
+        self.dispatched[index] += 1
+
+    def stop(self, timeout: float = 30):
+        for queue in self.queues:
+            queue.put(None)
+        for process in self.processes:
+            process.join(timeout)
+            if process.is_alive():
+                process.terminate()
+
+
+async def _set_webhook(bot: Bot):
+    await bot.set_webhook(
+        url=WEBHOOK_URL,
+        secret_token=WEBHOOK_SECRET,
+        allowed_updates=Update.ALL_TYPES,
+    )
+    logger.info(f"Webhook 已设置: {WEBHOOK_URL}")
+
+
+def create_app(workers: int = WEBHOOK_WORKERS) -> FastAPI:
+    """
+    workers <= 1：在本进程内运行 Application，收到的更新直接放入 update_queue；
+    workers > 1：本进程只负责接收与分发，更新按 chat_id 转给 worker 进程。
+    """
+    if not WEBHOOK_SECRET:
+        raise RuntimeError("WEBHOOK_SECRET 未设置，拒绝启动未校验来源的 webhook")
+
+    state = {}
+
+    @asynccontextmanager
+    async def lifespan(app: FastAPI):
+        if workers <= 1:
+            from telegram_bot.main import build_application, on_shutdown, on_startup
+
+            application = build_application(updater=False)
+            await application.initialize()
+            await on_startup(application)
+            await application.start()
+            state["application"] = application
+            await _set_webhook(application.bot)
+            try:
+                yield
+            finally:
+                await application.stop()
+                await on_shutdown(application)
+                await application.shutdown()
+        else:
+            pool = WorkerPool(workers)
+            pool.start()
+            state["pool"] = pool
+            bot = Bot(os.environ.get("BOT_TOKEN"))
+            async with bot:
+                await _set_webhook(bot)
+            try:
+                yield
+            finally:
+                pool.stop()
+
+    app = FastAPI(lifespan=lifespan)
+
+    @app.post(WEBHOOK_PATH)
+    async def telegram_webhook(request: Request):
+        token = request.headers.get(SECRET_HEADER, "")
+        if not hmac.compare_digest(token, WEBHOOK_SECRET):
+            raise HTTPException(status_code=403)
+
+        data = await request.json()
+        application = state.get("application")
+        if application:
+            await application.update_queue.put(Update.de_json(data, application.bot))
+        else:
+            state["pool"].dispatch(data)
+        return Response(status_code=200)
+
+    @app.get("/healthz")
+    async def healthz():
+        pool = state.get("pool")
+        if pool:
+            return {
+                "workers": pool.workers,
+                "alive": sum(p.is_alive() for p in pool.processes),
+                "dispatched": pool.dispatched,
+            }
+        return {"workers": 1, "alive": 1}
+
+    return app
+
+
+async def login_worker(index: int):
+    """在终端里交互登录 index 号 worker 的 Telethon 会话（每个 worker 需要独立的 auth key）"""
+    from telethon import TelegramClient
+
+    session_file = worker_session_file(index)
+    client = TelegramClient(
+        session_file, os.environ.get("API_ID"), os.environ.get("API_HASH")
+    )
+    await client.start()
+    me = await client.get_me()
+    logger.info(f"✅ worker {index} 已登录: {me.id}（{session_file}）")
+    await client.disconnect()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Telegram webhook 入口")
+    parser.add_argument(
+        "--login", type=int, metavar="INDEX", help="登录指定 worker 的 Telethon 会话后退出"
+    )
+    args = parser.parse_args()
+    if args.login is not None:
+        asyncio.run(login_worker(args.login))
+        return
+    uvicorn.run(create_app(), host=WEBHOOK_HOST, port=WEBHOOK_PORT)
+
+
+if __name__ == "__main__":
+    main()
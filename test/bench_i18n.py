@@ -0,0 +1,68 @@
+import time
+
+from telegram_bot.localization.i18n import I18n
+
+# 对比逐级遍历嵌套 dict（旧实现）与预编译平铺表的 I18n.t 调用速度
+# 运行：PYTHONPATH=src python test/bench_i18n.py
+ROUNDS = 200_000
+
+CALLS = [
+    ("zh", "general.welcome", {}),
+    ("en", "menu.subscribe", {}),
+    ("zh", "subscribe.plans.3m", {}),
+    ("en", "account.active_until", {"date": "2025-01-01"}),
+    (
+        "zh",
+        "account.status",
+        {"user_id": 123456, "signup_date": "2025-01-01", "sub_end_date": "2025-02-01"},
+    ),
+    ("fr", "menu.account", {}),
+    ("zh", "missing.key", {}),
+]
+
+
+def legacy_t(locales: dict, lang: str, key_path: str, **kwargs):
+    if lang not in locales:
+        lang = "zh"
+
+    value = locales.get(lang, {})
+    for key in key_path.split("."):
+        if isinstance(value, dict):
+            value = value.get(key)
+        else:
+            return key_path
+        if value is None:
+            return key_path
+    if isinstance(value, str):
+        try:
+            return value.format(**kwargs)
+        except Exception:
+            return value
+    return value
+
+
+def bench(name, func):
+    start = time.perf_counter()
+    for _ in range(ROUNDS):
+        for lang, key, kwargs in CALLS:
+            func(lang, key, **kwargs)
+    elapsed = time.perf_counter() - start
+    calls = ROUNDS * len(CALLS)
+    print(f"{name:<8} {calls / elapsed:>12,.0f} 次/秒  ({elapsed:.2f}s)")
+    return elapsed
+
+
+def main():
+    I18n.load_locales()
+    locales = I18n._locales
+
+    for lang, key, kwargs in CALLS:
+        assert legacy_t(locales, lang, key, **kwargs) == I18n.t(lang, key, **kwargs), key
+
+    before = bench("legacy", lambda lang, key, **kw: legacy_t(locales, lang, key, **kw))
+    after = bench("flat", I18n.t)
+    print(f"speedup  {before / after:.2f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,79 @@
+import sys
+
+import pysqlite3
+
+sys.modules["sqlite3"] = pysqlite3
+import asyncio
+from datetime import datetime, timedelta
+
+from sqlalchemy import event, select, update
+from sqlalchemy.ext.asyncio import AsyncSession, create_async_engine
+from sqlalchemy.orm import sessionmaker
+
+from telegram_bot.database.crud import delete_memberships, set_ban_members
+from telegram_bot.database.models import Base, Membership
+
+# 统计 1000 个用户封禁 / 删除时的数据库往返次数
+# 运行：PYTHONPATH=src python test/bench_membership_bulk.py
+USERS = 1000
+
+
+async def setup():
+    engine = create_async_engine("sqlite+aiosqlite://")
+    async with engine.begin() as conn:
+        await conn.run_sync(Base.metadata.create_all)
+    session_factory = sessionmaker(bind=engine, class_=AsyncSession, expire_on_commit=False)
+
+    now = datetime.utcnow()
+    async with session_factory() as session:
+        session.add_all(
+            Membership(
+                user_id=user_id,
+                start_time=now - timedelta(days=30),
+                end_time=now - timedelta(days=1),
+                source="bench",
+            )
+            for user_id in range(USERS)
+        )
+        await session.commit()
+
+    counter = {"n": 0}
+
+    def count(*args):
+        counter["n"] += 1
+
+    event.listen(engine.sync_engine, "before_cursor_execute", count)
+    return engine, session_factory, counter
+
+
+async def legacy_ban(session, user_ids):
+    # 旧实现：每个用户一次 SELECT + 一次 UPDATE
+    for user_id in user_ids:
+        result = await session.execute(select(Membership).where(Membership.user_id == user_id))
+        member = result.scalars().first()
+        await session.execute(
+            update(Membership)
+            .where(Membership.user_id == user_id, Membership.version == member.version)
+            .values(is_banned=True, banned_at=datetime.utcnow(), version=member.version + 1)
+        )
+    await session.commit()
+
+
+async def measure(name, func):
+    engine, session_factory, counter = await setup()
+    async with session_factory() as session:
+        start = asyncio.get_running_loop().time()
+        await func(session, list(range(USERS)))
+        elapsed = asyncio.get_running_loop().time() - start
+    print(f"{name:<24} 往返 {counter['n']:>5} 次 / {USERS} 用户，耗时 {elapsed * 1000:.1f} ms")
+    await engine.dispose()
+
+
+async def main():
+    await measure("legacy set_ban_members", legacy_ban)
+    await measure("set_ban_members", set_ban_members)
+    await measure("delete_memberships", delete_memberships)
+
+
+if __name__ == "__main__":
+    asyncio.run(main())